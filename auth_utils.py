@@ -1,17 +1,135 @@
+import time
+import hmac
+import base64
+import hashlib
+import binascii
+import threading
+from functools import lru_cache
 import jwt
+import orjson
+from cachetools import TLRUCache, cached
+from typing import Optional
 from fastapi import HTTPException, status, Depends
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.security import HTTPAuthorizationCredentials
+from auth import bearer_scheme
 
-def get_user_id_from_jwt(credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer())) -> str:
-    secret = None  # Set Supabase JWKS secret here
-    if not secret:
+SUPABASE_JWKS_SECRET = None  # Set Supabase JWKS secret here
+SUPABASE_JWKS_URL = None  # Set Supabase JWKS URL here (only for RS256/ES256 signing keys)
+
+# Key material is prepared once at import rather than coerced on every decode
+_SIGNING_KEY = SUPABASE_JWKS_SECRET.encode("utf-8") if SUPABASE_JWKS_SECRET else None
+_JWKS_CLIENT = jwt.PyJWKClient(SUPABASE_JWKS_URL, cache_keys=True) if SUPABASE_JWKS_URL else None
+_ASYMMETRIC_ALGORITHMS = ["RS256", "ES256"]
+_JWT_CONFIGURED = _SIGNING_KEY is not None or _JWKS_CLIENT is not None
+
+_EXPIRED_TOKEN_DETAIL = "Invalid authentication credentials: token has expired"
+_INVALID_TOKEN_DETAIL = "Invalid authentication credentials"
+
+# Decoded claims are cached per raw token for at most 60s, and never past the token's own expiry
+JWT_CACHE_TTL_SECONDS = 60
+_jwt_claims_cache = TLRUCache(
+    maxsize=4096,
+    ttu=lambda _token, claims, now: min(now + JWT_CACHE_TTL_SECONDS, claims.get("exp", now)),
+    timer=time.time,
+)
+
+
+@lru_cache(maxsize=16)
+def _get_jwks_signing_key(kid: str):
+    """Fetches and memoizes the parsed public key for a JWKS key id."""
+    return _JWKS_CLIENT.get_signing_key(kid).key
+
+
+def _b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _decode_hs256(token: str, key: bytes) -> dict:
+    """
+    Verifies an HS256 token with hmac directly and returns its claims.
+    Skips PyJWT's generic algorithm dispatch and option handling while enforcing
+    the same checks we rely on: alg, signature, required sub/exp, exp, nbf and iat.
+    """
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        signing_input = f"{header_b64}.{payload_b64}".encode("ascii")
+        header = orjson.loads(_b64url_decode(header_b64))
+        signature = _b64url_decode(signature_b64)
+    except (ValueError, binascii.Error) as e:
+        raise jwt.DecodeError(f"Invalid token: {e}")
+    if not isinstance(header, dict) or header.get("alg") != "HS256":
+        raise jwt.InvalidAlgorithmError("The specified alg value is not allowed")
+
+    expected = hmac.new(key, signing_input, hashlib.sha256).digest()
+    if not hmac.compare_digest(expected, signature):
+        raise jwt.InvalidSignatureError("Signature verification failed")
+
+    try:
+        claims = orjson.loads(_b64url_decode(payload_b64))
+    except (ValueError, binascii.Error) as e:
+        raise jwt.DecodeError(f"Invalid payload: {e}")
+    if not isinstance(claims, dict):
+        raise jwt.DecodeError("Invalid payload: not a JSON object")
+    for claim in ("sub", "exp"):
+        if claim not in claims:
+            raise jwt.MissingRequiredClaimError(claim)
+
+    now = time.time()
+    exp = claims["exp"]
+    if not isinstance(exp, (int, float)) or isinstance(exp, bool):
+        raise jwt.DecodeError("Expiration Time claim (exp) must be a number.")
+    if exp <= now:
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    nbf = claims.get("nbf")
+    if nbf is not None and (not isinstance(nbf, (int, float)) or nbf > now):
+        raise jwt.ImmatureSignatureError("The token is not yet valid (nbf)")
+    iat = claims.get("iat")
+    if iat is not None:
+        if not isinstance(iat, (int, float)) or isinstance(iat, bool):
+            raise jwt.InvalidIssuedAtError("Issued At claim (iat) must be an integer.")
+        if iat > now:
+            raise jwt.ImmatureSignatureError("The token is not yet valid (iat)")
+    return claims
+
+
+@cached(_jwt_claims_cache, lock=threading.Lock())
+def _decode_token(token: str) -> dict:
+    """
+    Verifies the JWT signature and returns its claims.
+    Results are memoized so the same token is only verified once per TTL window.
+    """
+    if _JWKS_CLIENT is not None:
+        header = jwt.get_unverified_header(token)
+        if header.get("alg") in _ASYMMETRIC_ALGORITHMS:
+            return jwt.decode(
+                token,
+                _get_jwks_signing_key(header.get("kid")),
+                algorithms=_ASYMMETRIC_ALGORITHMS,
+                options={"verify_aud": False, "require": ["sub", "exp"]},
+            )
+    if _SIGNING_KEY is None:
+        # Only a JWKS URL is configured, so there is no key to verify HS256 with
+        raise jwt.InvalidAlgorithmError("The specified alg value is not allowed")
+    return _decode_hs256(token, _SIGNING_KEY)
+
+def get_jwt_claims(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)) -> dict:
+    """
+    FastAPI dependency returning the verified claims of the bearer token.
+    FastAPI caches dependency results per request, so every consumer of the
+    claims (user_id, email, ...) shares a single decode.
+    """
+    if not _JWT_CONFIGURED:
         raise HTTPException(status_code=500, detail="SUPABASE_JWKS_SECRET not set.")
-    token = credentials.credentials
+    # bearer_scheme is shared with auto_error=False, so a missing header arrives as None
+    if credentials is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
     try:
-        payload = jwt.decode(token, secret, algorithms=["HS256"], options={"verify_aud": False})
-        user_id = payload.get("sub")
-        if not user_id:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication credentials")
-        return user_id
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Invalid authentication credentials: {str(e)}")
+        return _decode_token(credentials.credentials)
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=_EXPIRED_TOKEN_DETAIL) from None
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=_INVALID_TOKEN_DETAIL) from None
+
+def get_user_id_from_jwt(claims: dict = Depends(get_jwt_claims)) -> str:
+    # Presence of "sub" is enforced while decoding
+    return claims["sub"]
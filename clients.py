@@ -0,0 +1,59 @@
+import asyncio
+from typing import Optional
+import httpx
+from supabase import acreate_client, AsyncClient
+
+# Configure Supabase credentials here
+SUPABASE_URL = None  # Set Supabase URL here
+SUPABASE_KEY = None  # Set Supabase key here
+
+# One async client per process, shared by usage tracking, storage uploads and
+# record inserts: its GoTrue, PostgREST and storage sessions are built once and
+# keep their TLS connections alive across requests.
+_supabase: Optional[AsyncClient] = None
+_supabase_lock = asyncio.Lock()
+
+# supabase-py's sessions already speak HTTP/2 but use httpx's default pool,
+# which drops idle connections after 5s, so at modest traffic most calls would
+# still pay a fresh TLS handshake
+SUPABASE_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=100, keepalive_expiry=60)
+
+def _apply_pool_limits(session: httpx.AsyncClient) -> None:
+    """
+    Gives a supabase-py session SUPABASE_HTTP_LIMITS in place. Rebuilding the
+    session would drop whatever TLS verification and proxy settings it was
+    created with. httpx only takes limits when a client is built, so they are
+    set on the connection pools of its transport and of any proxy mounts.
+    """
+    for transport in (session._transport, *session._mounts.values()):
+        pool = getattr(transport, "_pool", None)
+        if pool is None:
+            continue
+        pool._max_connections = SUPABASE_HTTP_LIMITS.max_connections
+        pool._max_keepalive_connections = SUPABASE_HTTP_LIMITS.max_keepalive_connections
+        pool._keepalive_expiry = SUPABASE_HTTP_LIMITS.keepalive_expiry
+
+async def get_supabase() -> AsyncClient:
+    """Returns the shared Supabase client, creating it on first use."""
+    global _supabase
+    if _supabase is None:
+        async with _supabase_lock:
+            if _supabase is None:
+                client = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+                # Keep the PostgREST and storage connections alive between requests
+                _apply_pool_limits(client.postgrest.session)
+                _apply_pool_limits(client.storage.session)
+                _supabase = client
+    return _supabase
+
+async def close_supabase() -> None:
+    """Close the shared Supabase client's HTTP sessions (call on app shutdown)."""
+    global _supabase
+    if _supabase is not None:
+        await _supabase.postgrest.aclose()
+        await _supabase.storage.aclose()
+        await _supabase.auth.close()
+        # The functions client is created on first use, so it may not exist
+        if _supabase._functions is not None:
+            await _supabase._functions._client.aclose()
+        _supabase = None
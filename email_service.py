@@ -1,118 +1,203 @@
 """
 Email service for sending resume conversion notifications using Resend.
 """
+import os
+import asyncio
 import logging
-import jwt
 from typing import Optional
-from fastapi.security import HTTPAuthorizationCredentials
-import resend
+import httpx
+import orjson
+from fastapi import Depends
+from auth_utils import get_jwt_claims
 from email_templates import get_resume_conversion_email_template
+from queue_utils import BatchWorker
 
 logger = logging.getLogger(__name__)
 
 # Initialize Resend API key
-resend.api_key = None  # Set Resend API key here
+RESEND_API_KEY = None  # Set Resend API key here
 
-def get_email_from_jwt(credentials: HTTPAuthorizationCredentials) -> Optional[str]:
+# Shared async client for the Resend REST API; keeps TLS connections alive
+# across sends instead of blocking the event loop in the sync resend SDK.
+_http = httpx.AsyncClient(
+    base_url="https://api.resend.com",
+    timeout=10,
+    limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+    headers={"Authorization": f"Bearer {RESEND_API_KEY}", "Content-Type": "application/json"},
+)
+
+# Static part of every Resend request
+_PARAMS_BASE = {
+    "from": "YourApp <noreply@yourdomain.com>",  # Configure sender email here
+}
+
+# Outgoing email dispatch: notifications are queued and sent by a single
+# background worker in batches, paced to stay under the Resend rate limit.
+RESEND_RATE_LIMIT_PER_SECOND = 2  # Configure to match your Resend plan (shared by all uvicorn workers)
+EMAIL_BATCH_WINDOW_SECONDS = 0.5
+# Rate-limited (429), 5xx and network failures are retried with backoff
+EMAIL_SEND_RETRIES = 3
+EMAIL_RETRY_BASE_DELAY_SECONDS = 1.0
+EMAIL_BATCH_MAX_SIZE = 100  # Resend's batch endpoint accepts at most 100 emails
+EMAIL_QUEUE_MAX_SIZE = 1000
+
+# Earliest loop time the next Resend API call may be made at
+_next_send_at = 0.0
+
+def get_email_from_jwt(claims: dict = Depends(get_jwt_claims)) -> Optional[str]:
     """
-    Extract email from JWT token.
+    Extract email from verified JWT claims.
+    Usable as a FastAPI dependency: it reuses the request's single verified
+    decode from get_jwt_claims, so tokens without an email claim cost nothing extra.
     
     Args:
-        credentials: JWT credentials from FastAPI
+        claims: Decoded JWT claims from the get_jwt_claims dependency
         
     Returns:
         Optional[str]: Email if found in JWT, None otherwise
     """
-    try:
-        secret = None  # Set Supabase JWKS secret here
-        if not secret:
-            logger.error("SUPABASE_JWKS_SECRET not set")
-            return None
-            
-        token = credentials.credentials
-        payload = jwt.decode(token, secret, algorithms=["HS256"], options={"verify_aud": False})
-        email = payload.get("email")
-        
-        if not email:
-            logger.warning("No email found in JWT token")
-            return None
-            
-        return email
-    except Exception as e:
-        logger.error(f"Error extracting email from JWT: {e}")
-        return None
+    return claims.get("email") or None
 
-async def send_resume_conversion_email(
-    user_email: str, 
-    resume_link: str, 
-    conversion_type: str = "resume"
-) -> bool:
-    """
-    Send email notification after successful resume conversion.
-    
-    Args:
-        user_email: User's email address
-        resume_link: Public URL to the generated PDF
-        conversion_type: Type of conversion ("resume" or "json")
-    
-    Returns:
-        bool: True if email sent successfully, False otherwise
-    """
-    try:
-        # Get email template
-        subject, html_content = get_resume_conversion_email_template(
-            resume_link=resume_link,
-            conversion_type=conversion_type
-        )
-        
-        # Send email using Resend
-        params = {
-            "from": "YourApp <noreply@yourdomain.com>",  # Configure sender email here
-            "to": [user_email],
-            "subject": subject,
-            "html": html_content,
-        }
-        response = resend.Emails.send(params)
-        
-        logger.info(f"Email sent successfully to {user_email}. Response: {response}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Failed to send email to {user_email}: {e}")
-        return False
+def _build_email_params(user_email: str, resume_link: str, conversion_type: str) -> dict:
+    """Builds the Resend request params for a resume conversion email."""
+    subject, html_content = get_resume_conversion_email_template(
+        resume_link=resume_link,
+        conversion_type=conversion_type
+    )
+    return {**_PARAMS_BASE, "to": [user_email], "subject": subject, "html": html_content}
 
 async def send_resume_conversion_notification(
-    credentials: HTTPAuthorizationCredentials,
+    claims: dict,
     resume_link: str, 
     conversion_type: str = "resume"
 ) -> bool:
     """
     Main function to send resume conversion notification.
-    Extracts email from JWT token and sends the notification.
+    Extracts email from JWT claims and queues the notification for the
+    background email worker; it does not wait for the email to be sent.
     
     Args:
-        credentials: JWT credentials from FastAPI
+        claims: Decoded JWT claims from the get_jwt_claims dependency
         resume_link: Public URL to the generated PDF
         conversion_type: Type of conversion ("resume" or "json")
     
     Returns:
-        bool: True if email sent successfully, False otherwise
+        bool: True if email was queued successfully, False otherwise
     """
     try:
         # Get user email from JWT
-        user_email = get_email_from_jwt(credentials)
+        user_email = get_email_from_jwt(claims)
         
         if not user_email:
             logger.warning("No email found in JWT token")
             return False
         
-        # Send email
-        return await send_resume_conversion_email(
+        # Queue email
+        return enqueue_resume_conversion_email(
             user_email=user_email,
             resume_link=resume_link,
             conversion_type=conversion_type
         )
         
     except Exception as e:
-        logger.error(f"Error in send_resume_conversion_notification: {e}")
+        logger.error("Error in send_resume_conversion_notification: %s", e)
+        return False
+
+def enqueue_resume_conversion_email(
+    user_email: str,
+    resume_link: str,
+    conversion_type: str = "resume"
+) -> bool:
+    """
+    Queue a resume conversion email for the background worker.
+
+    Returns:
+        bool: True if the email was queued, False if the worker is not
+        running or the queue is full
+    """
+    if not _email_worker.running:
+        logger.error("Email worker is not running; dropping email to %s", user_email)
+        return False
+    try:
+        _email_worker.put_nowait(_build_email_params(user_email, resume_link, conversion_type))
+        return True
+    except asyncio.QueueFull:
+        logger.error("Email queue is full; dropping email to %s", user_email)
         return False
+
+async def _send_email_batch(batch: list[dict]) -> None:
+    """Send a batch of emails with a single Resend API call."""
+    if len(batch) == 1:
+        response = await _http.post("/emails", content=orjson.dumps(batch[0]))
+    else:
+        response = await _http.post("/emails/batch", content=orjson.dumps(batch))
+    response.raise_for_status()
+
+def _process_rate_limit() -> float:
+    """
+    Each uvicorn worker process runs its own email worker, so each gets an
+    equal share of the plan's rate (WEB_CONCURRENCY is uvicorn's worker count).
+    """
+    return RESEND_RATE_LIMIT_PER_SECOND / int(os.environ.get("WEB_CONCURRENCY", "1"))
+
+def _retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    """Seconds to wait before retrying a failed send, or None if it should not be retried."""
+    if isinstance(error, httpx.HTTPStatusError):
+        if error.response.status_code != 429 and error.response.status_code < 500:
+            return None
+        retry_after = error.response.headers.get("retry-after")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+    elif not isinstance(error, httpx.TransportError):
+        return None
+    return EMAIL_RETRY_BASE_DELAY_SECONDS * 2 ** attempt
+
+async def _deliver_email_batch(batch: list[dict]) -> None:
+    """
+    Sends a batch collected by the email worker, spacing API calls so they
+    never exceed this process's share of RESEND_RATE_LIMIT_PER_SECOND and
+    retrying batches Resend could not take yet.
+    """
+    global _next_send_at
+    loop = asyncio.get_running_loop()
+    min_interval = 1 / _process_rate_limit()
+    for attempt in range(EMAIL_SEND_RETRIES + 1):
+        delay = _next_send_at - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        _next_send_at = loop.time() + min_interval
+        try:
+            await _send_email_batch(batch)
+            logger.info("Sent %d notification email(s)", len(batch))
+            return
+        except Exception as e:
+            retry_delay = _retry_delay(e, attempt)
+            if retry_delay is None or attempt == EMAIL_SEND_RETRIES:
+                logger.error("Failed to send %d notification email(s): %s", len(batch), e)
+                return
+            logger.warning(
+                "Failed to send %d notification email(s), retrying in %.1fs: %s",
+                len(batch), retry_delay, e
+            )
+            _next_send_at = max(_next_send_at, loop.time() + retry_delay)
+
+# Drains queued emails in batches collected over EMAIL_BATCH_WINDOW_SECONDS
+_email_worker = BatchWorker(
+    _deliver_email_batch,
+    max_size=EMAIL_BATCH_MAX_SIZE,
+    window_seconds=EMAIL_BATCH_WINDOW_SECONDS,
+    queue_max_size=EMAIL_QUEUE_MAX_SIZE,
+    label="email(s)",
+)
+
+def start_email_worker() -> None:
+    """Create the email queue and start the background worker (call on app startup)."""
+    _email_worker.start()
+
+async def stop_email_worker(timeout: float = 10.0) -> None:
+    """Flush pending emails (up to timeout seconds) and stop the worker (call on app shutdown)."""
+    await _email_worker.stop(timeout)
+
+async def close_email_client() -> None:
+    """Close the shared Resend HTTP client (call on app shutdown)."""
+    await _http.aclose()
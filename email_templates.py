@@ -1,24 +1,13 @@
 """
 Email templates for resume conversion notifications.
 """
+import html
 
-def get_resume_conversion_email_template(
-    resume_link: str, 
-    conversion_type: str = "resume"
-) -> tuple[str, str]:
-    """
-    Generate HTML email template for resume conversion notification.
-    
-    Args:
-        resume_link: Public URL to the generated PDF
-        conversion_type: Type of conversion ("resume" or "json")
-    
-    Returns:
-        tuple: (subject, html_content)
-    """
-    subject = "Your Resume PDF is Ready! 📄"
-    
-    html_content = f"""
+_SUBJECT = "Your Resume PDF is Ready! 📄"
+
+# The HTML body is static apart from the download link, so it is kept as two
+# constant halves and only the link is spliced in per email.
+_TEMPLATE_PREFIX = """
     <!DOCTYPE html>
     <html>
     <head>
@@ -32,7 +21,9 @@ def get_resume_conversion_email_template(
             <p style="color: #000; margin: 0 0 30px 0; font-size: 16px; line-height: 1.5;">Your resume has been successfully converted to PDF. Click the button below to download:</p>
             
             <div style="text-align: center; margin: 30px 0;">
-                <a href="{resume_link}" 
+                <a href=\""""
+
+_TEMPLATE_SUFFIX = """\" 
                    style="background: #fff; color: #000; padding: 18px 36px; text-decoration: none; border: 3px solid #000; border-radius: 4px; font-weight: 600; display: inline-block; font-size: 16px;">
                     Download PDF Resume
                 </a>
@@ -41,5 +32,22 @@ def get_resume_conversion_email_template(
     </body>
     </html>
     """
+
+def get_resume_conversion_email_template(
+    resume_link: str, 
+    conversion_type: str = "resume"
+) -> tuple[str, str]:
+    """
+    Generate HTML email template for resume conversion notification.
+    
+    Args:
+        resume_link: Public URL to the generated PDF
+        conversion_type: Type of conversion ("resume" or "json")
+    
+    Returns:
+        tuple: (subject, html_content)
+    """
+    # Escape the link so characters like & or " can't break the href attribute
+    html_content = _TEMPLATE_PREFIX + html.escape(resume_link, quote=True) + _TEMPLATE_SUFFIX
     
-    return subject, html_content
+    return _SUBJECT, html_content
\ No newline at end of file
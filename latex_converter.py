@@ -1,56 +1,101 @@
 import os
 import logging
-from typing import Tuple
+from typing import Optional, Tuple
 from fastapi import HTTPException, status
-import anyio
 from latex_utils import (
     write_latex_to_file,
     build_pdflatex_command,
     run_pdflatex_command,
-    read_pdf_file,
+    build_latex_format,
+    strip_format_preamble,
+    get_latex_format,
+    use_prebuilt_latex_format,
+    make_latex_work_dir,
+    remove_latex_work_dir,
+    LATEX_FORMAT_NAME,
     get_pdf_and_tex_filenames,
     format_pdflatex_error
 )
+from prompts import LATEX_TEMPLATE
 
 logger = logging.getLogger(__name__)
 
-async def convert_latex_to_pdf(latex_content: str) -> Tuple[bytes, str]:
+# Private per-process directory holding the precompiled format
+_format_dir: Optional[str] = None
+
+async def prepare_latex_format() -> None:
+    """
+    Loads the format prebuilt in LATEX_FORMAT_DIR (see Dockerfile) or, failing
+    that, precompiles the LATEX_TEMPLATE preamble into a pdflatex format file.
+    Call once on application startup; failures only disable the fast path.
+    """
+    global _format_dir
+    prebuilt_dir = os.environ.get("LATEX_FORMAT_DIR")
+    if prebuilt_dir and use_prebuilt_latex_format(LATEX_TEMPLATE, prebuilt_dir):
+        logger.info("Using prebuilt LaTeX format from %s.", prebuilt_dir)
+        return
+    try:
+        _format_dir = make_latex_work_dir(prefix='latex-format-')
+        if await build_latex_format(LATEX_TEMPLATE, _format_dir):
+            logger.info("Precompiled LaTeX preamble into format '%s'.", LATEX_FORMAT_NAME)
+    except Exception as e:
+        logger.warning("Skipping LaTeX format precompilation: %s", e)
+
+def remove_latex_format() -> None:
+    """Removes the precompiled format's directory (call on app shutdown)."""
+    global _format_dir
+    if _format_dir is not None:
+        remove_latex_work_dir(_format_dir)
+        _format_dir = None
+
+async def convert_latex_to_pdf(latex_content: str) -> Tuple[str, str]:
     """
     Converts LaTeX content to a PDF file using pdflatex.
     Ignores pdflatex errors if PDF is successfully generated.
-    Runs pdflatex in a thread pool to avoid blocking the event loop.
+    Runs pdflatex as an asyncio subprocess to avoid blocking the event loop.
     
     Args:
         latex_content: String containing valid LaTeX code
         
     Returns:
-        Tuple[bytes, str]: PDF content and filename
+        Tuple[str, str]: Path to the generated PDF and its filename.
+        The PDF is left in its own work directory, which the caller must remove
+        with remove_latex_work_dir(os.path.dirname(pdf_path)) once it is done;
+        on failure the directory is removed here.
     """
+    output_dir = make_latex_work_dir()
+    delivered = False
     try:
-        # Create output directory if it doesn't exist
-        output_dir = os.path.join(os.getcwd(), 'latex_output')
-        os.makedirs(output_dir, exist_ok=True)
-        
-        tex_path = write_latex_to_file(latex_content, output_dir)
+        # Documents that reuse the template preamble verbatim compile only their
+        # body on top of the precompiled format
+        latex_body = strip_format_preamble(latex_content)
+        use_format = latex_body is not None
+        tex_path = write_latex_to_file(latex_body if use_format else latex_content, output_dir)
         pdf_filename, pdf_path = get_pdf_and_tex_filenames(tex_path)
-        pdflatex_cmd = build_pdflatex_command(tex_path, output_dir)
-        logger.info(f"Executing pdflatex command: {' '.join(pdflatex_cmd)}")
+        pdflatex_cmd = build_pdflatex_command(
+            tex_path, output_dir, fmt=get_latex_format() if use_format else None
+        )
+        logger.info("Executing pdflatex command: %s", pdflatex_cmd)
 
-        def sync_pdflatex():
-            return run_pdflatex_command(pdflatex_cmd, output_dir)
-        process = await anyio.to_thread.run_sync(sync_pdflatex)
+        process = await run_pdflatex_command(pdflatex_cmd, output_dir)
+
+        if use_format and not (os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 0):
+            logger.warning("Compilation with the precompiled format failed; retrying with the full document.")
+            with open(tex_path, 'w', encoding='utf-8') as f:
+                f.write(latex_content)
+            pdflatex_cmd = build_pdflatex_command(tex_path, output_dir)
+            process = await run_pdflatex_command(pdflatex_cmd, output_dir)
 
         # Log any errors but don't raise exception
         if process.returncode != 0:
-            logger.warning(f"pdflatex returned non-zero code: {process.returncode}")
-            logger.error(f"STDERR: {process.stderr}")
+            logger.warning("pdflatex returned non-zero code: %s", process.returncode)
+            logger.error("STDERR: %s", process.stderr)
 
         # Check if PDF was generated despite errors
         if os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 0:
-            # Read the PDF content
-            pdf_content = read_pdf_file(pdf_path)
-            logger.info(f"Successfully generated PDF: {pdf_filename} ({len(pdf_content)} bytes)")
-            return pdf_content, pdf_filename
+            logger.info("Successfully generated PDF: %s", pdf_filename)
+            delivered = True
+            return pdf_path, pdf_filename
         else:
             # Include last 20 lines of pdflatex stderr in the error detail for easier debugging
             last_stderr = format_pdflatex_error(process.stderr)
@@ -62,8 +107,24 @@ async def convert_latex_to_pdf(latex_content: str) -> Tuple[bytes, str]:
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error during LaTeX to PDF conversion: {e}", exc_info=True)
+        logger.error("Error during LaTeX to PDF conversion: %s", e, exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to convert LaTeX to PDF: {str(e)}"
-        )
\ No newline at end of file
+        )
+    finally:
+        # Failed (or cancelled) conversions leave nothing behind
+        if not delivered:
+            remove_latex_work_dir(output_dir)
+
+if __name__ == "__main__":
+    # Prebuilds the format into LATEX_FORMAT_DIR once for every worker to load
+    # (run at image build time, see Dockerfile). Without it workers build their
+    # own at startup, so a failure here does not fail the build.
+    import asyncio
+    format_dir = os.environ["LATEX_FORMAT_DIR"]
+    os.makedirs(format_dir, exist_ok=True)
+    if asyncio.run(build_latex_format(LATEX_TEMPLATE, format_dir)):
+        print(f"Built LaTeX format in {format_dir}")
+    else:
+        print("No LaTeX format built; workers will build their own at startup")
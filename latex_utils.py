@@ -1,54 +1,173 @@
 import os
+import shutil
+import asyncio
+import tempfile
 import subprocess
-import uuid
+import secrets
 import logging
-from typing import Tuple
+from typing import Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Each conversion gets its own directory for its .tex/.aux/.log/.pdf files,
+# created by mkdtemp (unpredictable name, owner-only permissions) and removed as
+# a whole once the PDF has been delivered or the conversion has failed. Prefer
+# tmpfs (/dev/shm) on Linux so pdflatex's intermediate writes never touch the disk.
+_TMPFS_ROOT = "/dev/shm"
+LATEX_WORK_ROOT = (
+    _TMPFS_ROOT if os.path.isdir(_TMPFS_ROOT) and os.access(_TMPFS_ROOT, os.W_OK) else tempfile.gettempdir()
+)
+
+def make_latex_work_dir(prefix: str = 'latex-') -> str:
+    """Creates a private directory under LATEX_WORK_ROOT and returns its path."""
+    return tempfile.mkdtemp(prefix=prefix, dir=LATEX_WORK_ROOT)
+
+def remove_latex_work_dir(work_dir: str) -> None:
+    """Removes a directory created by make_latex_work_dir and everything in it."""
+    shutil.rmtree(work_dir, ignore_errors=True)
+
 def write_latex_to_file(latex_content: str, output_dir: str) -> str:
     """
     Writes LaTeX content to a uniquely named .tex file in output_dir.
+    output_dir must already exist (see make_latex_work_dir).
     Returns the full path to the .tex file.
     """
-    os.makedirs(output_dir, exist_ok=True)
-    unique_id = str(uuid.uuid4())
-    tex_filename = f"{unique_id}.tex"
+    tex_filename = f"{secrets.token_urlsafe(12)}.tex"
     tex_path = os.path.join(output_dir, tex_filename)
     with open(tex_path, 'w', encoding='utf-8') as f:
         f.write(latex_content)
     return tex_path
 
-def build_pdflatex_command(tex_path: str, output_dir: str) -> list:
+def build_pdflatex_command(tex_path: str, output_dir: str, fmt: Optional[str] = None) -> list:
     """
     Returns the pdflatex command as a list for subprocess.
+    If fmt (a format name or path) is given, pdflatex starts from that
+    precompiled format instead of re-reading the preamble (the .tex file must
+    then contain only the body).
     """
     return [
         'pdflatex',
+        *([f'-fmt={fmt}'] if fmt else []),
         '-interaction=nonstopmode',
         '-output-directory', output_dir,
         tex_path
     ]
 
-def run_pdflatex_command(pdflatex_cmd: list, output_dir: str):
+# --- Precompiled preamble format ---
+# The template's preamble (\documentclass + \usepackage...) is dumped once into
+# LATEX_FORMAT_NAME.fmt (at image build time, or per process at startup), so
+# documents that reuse it verbatim skip re-loading every package on each compilation.
+LATEX_FORMAT_NAME = 'resume'
+_BEGIN_DOCUMENT = '\\begin{document}'
+_format_preamble: Optional[str] = None
+_format_path: Optional[str] = None
+
+def split_latex_preamble(latex_content: str) -> Tuple[str, str]:
     """
-    Runs the pdflatex command synchronously in the given directory.
-    Returns the subprocess.CompletedProcess instance.
+    Splits LaTeX source into (preamble, body) at \\begin{document}.
+    Returns an empty preamble if the marker is missing.
     """
-    return subprocess.run(
-        pdflatex_cmd,
-        capture_output=True,
-        text=True,
-        check=False,
-        cwd=output_dir
+    idx = latex_content.find(_BEGIN_DOCUMENT)
+    if idx < 0:
+        return '', latex_content
+    return latex_content[:idx], latex_content[idx:]
+
+def _format_preamble_source(preamble: str) -> str:
+    return preamble + '\n\\dump\n'
+
+async def build_latex_format(template: str, output_dir: str) -> bool:
+    """
+    Dumps the preamble of template into a pdflatex format file in output_dir.
+    Returns True if the format is available for later compilations.
+    """
+    global _format_preamble, _format_path
+    preamble, _ = split_latex_preamble(template)
+    if not preamble.strip():
+        return False
+    # Built under a per-process job name and moved into place once complete, so
+    # a process sharing output_dir never loads a half-written format file
+    jobname = f'{LATEX_FORMAT_NAME}-{os.getpid()}'
+    preamble_filename = f'{jobname}_preamble.tex'
+    with open(os.path.join(output_dir, preamble_filename), 'w', encoding='utf-8') as f:
+        f.write(_format_preamble_source(preamble))
+    process = await run_pdflatex_command(
+        ['pdflatex', '-ini', '-interaction=nonstopmode', f'-jobname={jobname}', '&pdflatex', preamble_filename],
+        output_dir,
     )
+    built_format = os.path.join(output_dir, f'{jobname}.fmt')
+    if process.returncode != 0 or not os.path.exists(built_format):
+        logger.warning("Could not build LaTeX format file: %s", format_pdflatex_error(process.stdout))
+        return False
+    os.replace(built_format, os.path.join(output_dir, f'{LATEX_FORMAT_NAME}.fmt'))
+    os.replace(
+        os.path.join(output_dir, preamble_filename),
+        os.path.join(output_dir, f'{LATEX_FORMAT_NAME}_preamble.tex'),
+    )
+    _format_preamble = preamble.strip()
+    _format_path = os.path.join(output_dir, LATEX_FORMAT_NAME)
+    return True
+
+def use_prebuilt_latex_format(template: str, format_dir: str) -> bool:
+    """
+    Adopts a format previously built by build_latex_format in format_dir, if it
+    was built from template's preamble. Returns True if it is now in use.
+    """
+    global _format_preamble, _format_path
+    preamble, _ = split_latex_preamble(template)
+    if not preamble.strip():
+        return False
+    try:
+        with open(os.path.join(format_dir, f'{LATEX_FORMAT_NAME}_preamble.tex'), encoding='utf-8') as f:
+            built_from = f.read()
+    except OSError:
+        return False
+    if built_from != _format_preamble_source(preamble) or not os.path.exists(
+        os.path.join(format_dir, f'{LATEX_FORMAT_NAME}.fmt')
+    ):
+        return False
+    _format_preamble = preamble.strip()
+    _format_path = os.path.join(format_dir, LATEX_FORMAT_NAME)
+    return True
+
+def get_latex_format() -> Optional[str]:
+    """Returns the path of the precompiled format (without .fmt), or None if none was built."""
+    return _format_path
 
-def read_pdf_file(pdf_path: str) -> bytes:
+def strip_format_preamble(latex_content: str) -> Optional[str]:
     """
-    Reads and returns the content of the PDF file.
+    Returns only the document body if latex_content's preamble matches the
+    precompiled format, otherwise None (the full document must be compiled).
     """
-    with open(pdf_path, 'rb') as f:
-        return f.read()
+    if _format_preamble is None:
+        return None
+    preamble, body = split_latex_preamble(latex_content)
+    return body if preamble.strip() == _format_preamble else None
+
+# pdflatex is CPU-bound, so never run more compilations at once than there are
+# cores. Every uvicorn worker has its own semaphore, so the cores are split
+# between the WEB_CONCURRENCY workers (uvicorn's default for --workers)
+MAX_CONCURRENT_LATEX = max(1, (os.cpu_count() or 1) // int(os.environ.get("WEB_CONCURRENCY", "1")))
+_latex_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LATEX)
+
+async def run_pdflatex_command(pdflatex_cmd: list, output_dir: str) -> subprocess.CompletedProcess:
+    """
+    Runs the pdflatex command as an asyncio subprocess in the given directory.
+    Returns a subprocess.CompletedProcess with decoded stdout/stderr.
+    """
+    async with _latex_semaphore:
+        process = await asyncio.create_subprocess_exec(
+            *pdflatex_cmd,
+            cwd=output_dir,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await process.communicate()
+    return subprocess.CompletedProcess(
+        pdflatex_cmd,
+        process.returncode,
+        stdout.decode('utf-8', errors='replace'),
+        stderr.decode('utf-8', errors='replace'),
+    )
 
 def get_pdf_and_tex_filenames(tex_path: str) -> Tuple[str, str]:
     """
@@ -60,5 +179,18 @@ def get_pdf_and_tex_filenames(tex_path: str) -> Tuple[str, str]:
     return pdf_filename, pdf_path
 
 def format_pdflatex_error(stderr: str, num_lines: int = 20) -> str:
-    lines = stderr.splitlines()
-    return '\n'.join(lines[-num_lines:]) if lines else 'No stderr output.'
+    """
+    Returns the last num_lines lines of stderr.
+    Scans backwards for newlines so huge logs are never split into a full list.
+    """
+    if not stderr:
+        return 'No stderr output.'
+    end = len(stderr)
+    if stderr.endswith('\n'):
+        end -= 1
+    start = end
+    for _ in range(num_lines):
+        start = stderr.rfind('\n', 0, start)
+        if start < 0:
+            break
+    return stderr[start + 1:end]
@@ -4,8 +4,12 @@ import sys
 import logging
 import time
 import json
+from contextlib import asynccontextmanager
+
+import anyio
 
 from fastapi import (
+    BackgroundTasks,
     FastAPI,
     File,
     UploadFile,
@@ -18,8 +22,7 @@ from fastapi import (
     Response,
 )
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import FileResponse, ORJSONResponse
 
 # Import from project modules
 from models import (
@@ -29,18 +32,32 @@ from models import (
     ResumeData,
     JsonToLatexResponse,
 )
-from utils import extract_text_from_file
+from utils import MAX_FILE_SIZE, extract_text_from_file, start_parse_pool, stop_parse_pool
 from resume_processor import (
     setup_resume_tailoring_chain,
+    BatchedChain,
     generate_tailored_resume,
     generate_latex_resume,
+    cache_latex_resume,
 )
 from auth import bearer_scheme
-from latex_converter import convert_latex_to_pdf
-from auth_utils import get_user_id_from_jwt
-from usage import check_user_usage_limits, increment_user_usage
-from supabase_utils import upload_pdf_to_bucket, insert_resume_record
-from email_service import send_resume_conversion_notification
+from latex_converter import convert_latex_to_pdf, prepare_latex_format, remove_latex_format
+from latex_utils import remove_latex_work_dir
+from auth_utils import get_jwt_claims, get_user_id_from_jwt
+from usage import reserved_usage
+from clients import close_supabase
+from supabase_utils import (
+    insert_resume_record,
+    start_insert_worker,
+    stop_insert_worker,
+    upload_pdf_to_bucket,
+)
+from email_service import (
+    close_email_client,
+    send_resume_conversion_notification,
+    start_email_worker,
+    stop_email_worker,
+)
 import shutil
 
 # --- Initial Setup ---
@@ -62,277 +79,339 @@ try:
     resume_tailoring_chain, latex_conversion_chain = setup_resume_tailoring_chain(
         model_name=None  # Set model name here
     )
+    # Bound concurrent model calls; calls that queue up meanwhile are sent together.
+    # Tailoring is sampled per request, so identical requests are not merged
+    resume_tailoring_chain = BatchedChain(resume_tailoring_chain, dedupe=False)
+    latex_conversion_chain = BatchedChain(latex_conversion_chain)
     logger.info("LangChain chains setup complete.")
 except Exception as e:
     logger.critical(
-        f"FATAL: Failed to initialize LangChain chains on startup: {e}", exc_info=True
+        "FATAL: Failed to initialize LangChain chains on startup: %s", e, exc_info=True
     )
     sys.exit(f"Startup failed: Could not initialize LangChain: {e}")
 
+# --- Application Lifespan ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Prepares shared resources on startup and releases them on shutdown."""
+    # Blocking filesystem calls and sync dependencies run on AnyIO's thread
+    # pool; raise its default cap of 40 so they don't queue behind each other
+    anyio.to_thread.current_default_thread_limiter().total_tokens = 100
+    await prepare_latex_format()
+    start_parse_pool()
+    start_email_worker()
+    start_insert_worker()
+    yield
+    await resume_tailoring_chain.aclose()
+    await latex_conversion_chain.aclose()
+    stop_parse_pool()
+    await stop_email_worker()
+    await stop_insert_worker()
+    await close_supabase()
+    await close_email_client()
+    remove_latex_format()
+
+
 # --- FastAPI Application Instance ---
 app = FastAPI(
     title="AI Resume Tailoring API",
     description="Tailors resumes based on job descriptions using AI.",
     version="0.2.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
+# --- Request Size Middleware ---
+# Room for multipart boundaries and form fields on top of the file size limit
+MAX_REQUEST_BODY_SIZE = MAX_FILE_SIZE + 1024 * 1024
+
+
+class _RequestBodyTooLarge(Exception):
+    """Raised from the wrapped receive once a body passes the size limit."""
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Rejects requests whose body exceeds max_body_size with a 413. A declared
+    Content-Length is checked before any of the body is read; bodies without
+    one (chunked uploads) are counted as they arrive and cut off as soon as
+    they pass the limit, before the rest is read or spooled to disk.
+    """
+
+    def __init__(self, app, max_body_size: int):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if value.isdigit() and int(value) > self.max_body_size:
+                    await self._reject(scope, receive, send)
+                    return
+                break
+
+        received = 0
+        response_started = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    if not response_started:
+                        rejected = True
+                        await self._reject(scope, receive, send)
+                    raise _RequestBodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            # Once the 413 is out, drop whatever the app answers to the aborted read
+            if rejected:
+                return
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _RequestBodyTooLarge:
+            if not rejected:
+                raise
+
+    @staticmethod
+    async def _reject(scope, receive, send) -> None:
+        response = ORJSONResponse({"detail": "Request body too large."}, status_code=413)
+        await response(scope, receive, send)
+
+
+# Added before CORS so that CORS wraps it and 413s still carry CORS headers
+app.add_middleware(RequestSizeLimitMiddleware, max_body_size=MAX_REQUEST_BODY_SIZE)
+
 # --- CORS Middleware ---
-origins = ["*"]  # Configure allowed origins here
+# Browsers reject a wildcard origin on credentialed requests, so origins are listed explicitly
+ALLOWED_ORIGINS = ("https://resumedogs.app",)  # Configure allowed frontend origins here
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=origins,
+    allow_origins=list(ALLOWED_ORIGINS),
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Authorization", "Content-Type"],
+    max_age=86400,  # Let browsers cache preflight responses for a day
 )
 
+# --- Helpers ---
+
+
+async def validate_upload(
+    resume_file: UploadFile = File(
+        ..., description="The user's resume file (PDF, DOCX, MD, TXT)."
+    ),
+) -> UploadFile:
+    """Rejects uploads without a filename before any usage lookup or parsing."""
+    if not resume_file.filename:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Filename cannot be empty."
+        )
+    return resume_file
+
+
+_LATEX_UPLOAD_EXTENSIONS = frozenset({".pdf", ".md", ".docx", ".doc"})
+
+
+async def validate_latex_upload(
+    resume_file: UploadFile = Depends(validate_upload),
+) -> UploadFile:
+    """Additionally restricts /convert-latex uploads to the formats it can convert."""
+    if os.path.splitext(resume_file.filename)[1].lower() not in _LATEX_UPLOAD_EXTENSIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only PDF, Markdown (.md), DOCX, and DOC files are supported.",
+        )
+    return resume_file
+
+
+async def _upload_and_record(local_pdf_path: str, pdf_filename: str, user_id: str) -> str:
+    """
+    Uploads a compiled PDF, queues its resume record and returns its public URL.
+    The conversion's work directory is removed whether or not these succeed.
+    """
+    try:
+        public_url = await upload_pdf_to_bucket(local_pdf_path, pdf_filename)
+        await insert_resume_record(public_url, user_id)
+        return public_url
+    finally:
+        await anyio.to_thread.run_sync(remove_latex_work_dir, os.path.dirname(local_pdf_path))
+
+
+async def _publish_pdf(
+    local_pdf_path: str, pdf_filename: str, user_id: str, claims: dict, conversion_type: str
+) -> None:
+    """
+    Uploads an already-delivered PDF, records it, emails the link and removes
+    the local files. Runs as a background task, so failures are only logged.
+    """
+    try:
+        public_url = await _upload_and_record(local_pdf_path, pdf_filename, user_id)
+        await send_resume_conversion_notification(
+            claims=claims, resume_link=public_url, conversion_type=conversion_type
+        )
+    except Exception as e:
+        logger.error("Failed to publish %s for user %s: %s", pdf_filename, user_id, e, exc_info=True)
+
+
 # --- API Endpoints ---
 
 
+# Rendered once; returning a Response skips validation and serialization per probe
+_HEALTH_RESPONSE = ORJSONResponse({"message": "API is running!"})
+
+
 @app.get("/health", tags=["Status"], response_model=MessageResponse)
 async def health_check():
     """Simple health check endpoint."""
-    return {"message": "API is running!"}
+    return _HEALTH_RESPONSE
 
 
 @app.post("/tailor", tags=["Resume"], response_model=TailoredResumeResponse)
 async def tailor_resume_endpoint(
-    credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer()),
     job_description: str = Form(
         ..., min_length=50, description="The full text of the job description."
     ),
-    resume_file: UploadFile = File(
-        ..., description="The user's resume file (PDF, DOCX, MD, TXT)."
-    ),
+    resume_file: UploadFile = Depends(validate_upload),
+    user_id: str = Depends(get_user_id_from_jwt),
 ):
     """
     Receives a job description and a resume file, tailors the resume,
     and returns the result.
     """
-    # Extract user_id from JWT
-    user_id = get_user_id_from_jwt(credentials)
-    logger.info(f"Request from user_id: {user_id}")
-
-    # Check usage limits
-    daily, monthly = check_user_usage_limits(user_id)
-    daily_current_str = (
-        str(daily.current_usage) if hasattr(daily, "current_usage") else str(daily)
-    )
-    daily_limit_str = str(daily.limit) if hasattr(daily, "limit") else "N/A"
-    monthly_current_str = (
-        str(monthly.current_usage)
-        if hasattr(monthly, "current_usage")
-        else str(monthly)
-    )
-    monthly_limit_str = str(monthly.limit) if hasattr(monthly, "limit") else "N/A"
-    logger.info(
-        f"User usage: Daily={daily_current_str}/{daily_limit_str}, Monthly={monthly_current_str}/{monthly_limit_str}"
-    )
+    logger.info("Request from user_id: %s", user_id)
 
     start_time = time.time()
-    logger.info(f"Received tailor request for file '{resume_file.filename}'.")
-
-    if not resume_file.filename:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Filename cannot be empty."
-        )
-
-    try:
-        original_resume_text = await extract_text_from_file(resume_file)
-        logger.info(
-            f"Extracted {len(original_resume_text)} chars from '{resume_file.filename}'."
-        )
+    logger.info("Received tailor request for file '%s'.", resume_file.filename)
 
-        if not resume_tailoring_chain:
-            logger.critical("Resume tailoring chain is not available.")
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Resume processing service temporarily unavailable.",
+    # Reserve one conversion only now that the request has passed validation;
+    # it is refunded if anything below fails
+    async with reserved_usage(user_id):
+        try:
+            original_resume_text = await extract_text_from_file(resume_file)
+            logger.info(
+                "Extracted %s chars from '%s'.",
+                len(original_resume_text), resume_file.filename
             )
 
-        modified_resume_text = await generate_tailored_resume(
-            resume_content=original_resume_text,
-            job_description=job_description,
-            chain=resume_tailoring_chain,
-        )
-        logger.info(f"Successfully generated tailored resume.")
-
-        end_time = time.time()
-        processing_time_ms = (end_time - start_time) * 1000
-        logger.info(f"Request completed in {processing_time_ms:.2f} ms.")
+            if not resume_tailoring_chain:
+                logger.critical("Resume tailoring chain is not available.")
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Resume processing service temporarily unavailable.",
+                )
+
+            modified_resume_text = await generate_tailored_resume(
+                resume_content=original_resume_text,
+                job_description=job_description,
+                chain=resume_tailoring_chain,
+            )
+            logger.info("Successfully generated tailored resume.")
 
-        # Increment usage counters
-        increment_user_usage(user_id, daily, monthly)
+            end_time = time.time()
+            processing_time_ms = (end_time - start_time) * 1000
+            logger.info("Request completed in %.2f ms.", processing_time_ms)
 
-        return TailoredResumeResponse(
-            filename=resume_file.filename,
-            original_content_length=len(original_resume_text),
-            job_description_length=len(job_description),
-            tailored_resume_text=modified_resume_text,
-        )
+            return TailoredResumeResponse(
+                filename=resume_file.filename,
+                original_content_length=len(original_resume_text),
+                job_description_length=len(job_description),
+                tailored_resume_text=modified_resume_text,
+            )
 
-    except HTTPException as he:
-        raise he
-    except ValueError as ve:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
-    except RuntimeError as re:
-        logger.error(f"Runtime error during processing: {re}", exc_info=True)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(re)
-        )
-    except Exception as e:
-        logger.error(f"Unexpected error: {e}", exc_info=True)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="An unexpected error occurred.",
-        )
+        except HTTPException as he:
+            raise he
+        except ValueError as ve:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+        except RuntimeError as re:
+            logger.error("Runtime error during processing: %s", re, exc_info=True)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(re)
+            )
+        except Exception as e:
+            logger.error("Unexpected error: %s", e, exc_info=True)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="An unexpected error occurred.",
+            )
 
 
 @app.post("/convert-latex", tags=["Resume"])
 async def convert_to_latex_endpoint(
-    credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer()),
-    resume_file: UploadFile = File(
-        ..., description="The user's resume file (PDF, DOCX, MD, DOC)."
-    ),
+    background_tasks: BackgroundTasks,
+    claims: dict = Depends(get_jwt_claims),
+    resume_file: UploadFile = Depends(validate_latex_upload),
+    user_id: str = Depends(get_user_id_from_jwt),
 ) -> Response:
     """
     Converts a resume file to LaTeX format and returns a compiled PDF.
     Adds JWT authentication, user usage limit check, and removes Stripe dependencies.
     """
-    # Extract user_id from JWT
-    user_id = get_user_id_from_jwt(credentials)
-    # Check usage limits
-    daily, monthly = check_user_usage_limits(user_id)
-    daily_current_str = (
-        str(daily.current_usage) if hasattr(daily, "current_usage") else str(daily)
-    )
-    daily_limit_str = str(daily.limit) if hasattr(daily, "limit") else "N/A"
-    monthly_current_str = (
-        str(monthly.current_usage)
-        if hasattr(monthly, "current_usage")
-        else str(monthly)
-    )
-    monthly_limit_str = str(monthly.limit) if hasattr(monthly, "limit") else "N/A"
-    logger.info(
-        f"User usage: Daily={daily_current_str}/{daily_limit_str}, Monthly={monthly_current_str}/{monthly_limit_str}"
-    )
-
-    # Parse file and convert to LaTeX
-    try:
-        if not resume_file.filename:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Filename cannot be empty.",
-            )
-        if not resume_file.filename.lower().endswith((".pdf", ".md", ".docx", ".doc")):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Only PDF, Markdown (.md), DOCX, and DOC files are supported.",
-            )
-        original_resume_text = await extract_text_from_file(resume_file)
-        latex_resume_text = await generate_latex_resume(
-            resume_content=original_resume_text, chain=latex_conversion_chain
-        )
-        pdf_content, pdf_filename = await convert_latex_to_pdf(latex_resume_text)
-
-        # Upload PDF to Supabase bucket and get public link
-        local_pdf_path = os.path.join(os.getcwd(), "latex_output", pdf_filename)
-        public_url = upload_pdf_to_bucket(local_pdf_path, pdf_filename)
-
-        # Insert record into resume_table
-        insert_resume_record(public_url, user_id)
-
-        # Send email notification
+    # Reserve one conversion only now that the upload has passed validation;
+    # it is refunded if anything below fails
+    async with reserved_usage(user_id):
+        # Parse file and convert to LaTeX
         try:
-            email_sent = await send_resume_conversion_notification(
-                credentials=credentials,
+            original_resume_text = await extract_text_from_file(resume_file)
+            latex_resume_text = await generate_latex_resume(
+                resume_content=original_resume_text, chain=latex_conversion_chain
+            )
+            local_pdf_path, pdf_filename = await convert_latex_to_pdf(latex_resume_text)
+            cache_latex_resume(original_resume_text, latex_resume_text)
+
+            # Upload PDF to Supabase bucket, insert record into resume_table and
+            # remove this conversion's files
+            public_url = await _upload_and_record(local_pdf_path, pdf_filename, user_id)
+
+            # Queue email notification once the response has been sent
+            # (failures are logged by the email service and never fail the request)
+            background_tasks.add_task(
+                send_resume_conversion_notification,
+                claims=claims,
                 resume_link=public_url,
-                conversion_type="resume"
+                conversion_type="resume",
             )
-            if email_sent:
-                logger.info(f"Email notification sent to user {user_id}")
-            else:
-                logger.warning(f"Failed to send email notification to user {user_id}")
-        except Exception as email_error:
-            logger.error(f"Error sending email notification: {email_error}")
-            # Don't fail the main request if email fails
-
-        # Clean up only files related to this PDF conversion
-        latex_output_dir = os.path.join(os.getcwd(), "latex_output")
-        base_name, _ = os.path.splitext(pdf_filename)
-        for ext in [".pdf", ".tex", ".aux", ".log", ".out"]:
-            file_path = os.path.join(latex_output_dir, f"{base_name}{ext}")
-            try:
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-            except Exception as cleanup_err:
-                logger.warning(f"Failed to delete {file_path}: {cleanup_err}")
-
-    except HTTPException as he:
-        raise he
-    except Exception as e:
-        logger.error(f"Error in convert-latex endpoint: {e}", exc_info=True)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
-        )
-    # Increment usage counters
-    increment_user_usage(user_id, daily, monthly)
-    daily_log_val = "N/A"
-    if (
-        hasattr(daily, "current_usage")
-        and getattr(daily, "current_usage", None) is not None
-    ):
-        daily_log_val = str(daily.current_usage + 1)
-    elif isinstance(daily, int):
-        daily_log_val = str(daily + 1)
-
-    monthly_log_val = "N/A"
-    if (
-        hasattr(monthly, "current_usage")
-        and getattr(monthly, "current_usage", None) is not None
-    ):
-        monthly_log_val = str(monthly.current_usage + 1)
-    elif isinstance(monthly, int):
-        monthly_log_val = str(monthly + 1)
-    logger.info(
-        f"Incremented usage for user {user_id}. New usage: Daily={daily_log_val}, Monthly={monthly_log_val}"
-    )
 
+        except HTTPException as he:
+            raise he
+        except Exception as e:
+            logger.error("Error in convert-latex endpoint: %s", e, exc_info=True)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+            )
     return {"resume_link": public_url}
 
 
 @app.post("/convert-json-to-latex", tags=["Resume"], response_model=JsonToLatexResponse)
 async def convert_json_to_latex_endpoint(
     resume_data: ResumeData,  # Expect ResumeData model as request body
-    credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer()),
+    background_tasks: BackgroundTasks,
+    claims: dict = Depends(get_jwt_claims),
+    user_id: str = Depends(get_user_id_from_jwt),
+    accept: str | None = Header(default=None),
 ) -> JsonToLatexResponse:
     """
     Converts structured JSON resume data to LaTeX format and returns a compiled PDF.
     Requires JWT authentication and tracks user usage.
+    Clients sending `Accept: application/pdf` receive the PDF itself as soon as
+    it compiles; it is uploaded and recorded after the response is sent.
     """
     start_time = time.time()
     logger.info("Received convert-json-to-latex request.")
 
-    # Extract user_id from JWT
-    user_id = get_user_id_from_jwt(credentials)
-    logger.info(f"Request from user_id: {user_id}")
-
-    # Check usage limits
-    daily, monthly = check_user_usage_limits(user_id)
-    daily_current_str = (
-        str(daily.current_usage) if hasattr(daily, "current_usage") else str(daily)
-    )
-    daily_limit_str = str(daily.limit) if hasattr(daily, "limit") else "N/A"
-    monthly_current_str = (
-        str(monthly.current_usage)
-        if hasattr(monthly, "current_usage")
-        else str(monthly)
-    )
-    monthly_limit_str = str(monthly.limit) if hasattr(monthly, "limit") else "N/A"
-    logger.info(
-        f"User usage: Daily={daily_current_str}/{daily_limit_str}, Monthly={monthly_current_str}/{monthly_limit_str}"
-    )
+    logger.info("Request from user_id: %s", user_id)
 
     if not latex_conversion_chain:
         logger.critical("LaTeX conversion chain is not available.")
@@ -341,142 +420,99 @@ async def convert_json_to_latex_endpoint(
             detail="Resume processing service temporarily unavailable.",
         )
 
-    try:
-        # Convert Pydantic model to JSON string to be used as resume_content
-        # The LATEX_CONVERSION_PROMPT expects a string, so we provide the JSON as a string.
-        resume_content_json_string = resume_data.model_dump_json(indent=2)
-        logger.info(
-            f"Successfully converted input JSON data to string. Length: {len(resume_content_json_string)}"
-        )
-
-        latex_resume_text = await generate_latex_resume(
-            resume_content=resume_content_json_string,  # Pass the JSON string here
-            chain=latex_conversion_chain,
-        )
-        logger.info(
-            f"Successfully generated LaTeX from JSON data. LaTeX length: {len(latex_resume_text)}"
-        )
-
-        pdf_content, pdf_filename = await convert_latex_to_pdf(latex_resume_text)
-        logger.info(f"Successfully compiled LaTeX to PDF: {pdf_filename}")
-
-        # Upload PDF to Supabase bucket and get public link
-        # Ensure 'latex_output' directory exists (convert_latex_to_pdf should handle this, but good practice)
-        latex_output_dir = os.path.join(os.getcwd(), "latex_output")
-        os.makedirs(latex_output_dir, exist_ok=True)
-        local_pdf_path = os.path.join(latex_output_dir, pdf_filename)
+    # Reserve one conversion only now that the body has passed validation;
+    # it is refunded if anything below fails
+    async with reserved_usage(user_id):
+        try:
+            # Convert Pydantic model to JSON string to be used as resume_content
+            # The LATEX_CONVERSION_PROMPT expects a string, so we provide the JSON as a string.
+            # Compact output: indentation only adds input tokens for the model
+            resume_content_json_string = resume_data.model_dump_json()
+            logger.info(
+                "Successfully converted input JSON data to string. Length: %s",
+                len(resume_content_json_string)
+            )
 
-        # convert_latex_to_pdf already writes the file, so we just need to ensure the path is correct for upload
-        if not os.path.exists(local_pdf_path):
-            # This case should ideally not happen if convert_latex_to_pdf succeeds
-            # and writes the file as expected.
-            logger.error(
-                f"PDF file not found at {local_pdf_path} after generation. This is unexpected."
+            latex_resume_text = await generate_latex_resume(
+                resume_content=resume_content_json_string,  # Pass the JSON string here
+                chain=latex_conversion_chain,
             )
-            # Fallback: attempt to write pdf_content to local_pdf_path if it wasn't found
-            # This might indicate an issue in convert_latex_to_pdf's file handling logic if it occurs
-            with open(local_pdf_path, "wb") as f_pdf:
-                f_pdf.write(pdf_content)
             logger.info(
-                f"Manually wrote PDF content to {local_pdf_path} as a fallback."
+                "Successfully generated LaTeX from JSON data. LaTeX length: %s",
+                len(latex_resume_text)
             )
 
-        public_url = upload_pdf_to_bucket(local_pdf_path, pdf_filename)
-        logger.info(f"Successfully uploaded PDF to Supabase. Public URL: {public_url}")
-
-        # Insert record into resume_table
-        insert_resume_record(public_url, user_id)  # Added source_type
-        logger.info(
-            f"Successfully inserted resume record for user {user_id} with URL {public_url}"
-        )
+            local_pdf_path, pdf_filename = await convert_latex_to_pdf(latex_resume_text)
+            logger.info("Successfully compiled LaTeX to PDF: %s", pdf_filename)
+            cache_latex_resume(resume_content_json_string, latex_resume_text)
+
+            if accept and "application/pdf" in accept:
+                # Stream the compiled file straight back; FastAPI runs the
+                # background tasks (upload, record, email, cleanup) afterwards
+                background_tasks.add_task(
+                    _publish_pdf, local_pdf_path, pdf_filename, user_id, claims, "json"
+                )
+                return FileResponse(
+                    local_pdf_path, media_type="application/pdf", filename=pdf_filename
+                )
+
+            # Upload PDF to Supabase bucket straight from the compiled file, insert
+            # record into resume_table and remove the generated files
+            # (PDF, .tex, .aux, .log, .out)
+            public_url = await _upload_and_record(local_pdf_path, pdf_filename, user_id)
+            logger.info(
+                "Uploaded PDF and queued resume record for user %s with URL %s",
+                user_id, public_url
+            )
 
-        # Send email notification
-        try:
-            email_sent = await send_resume_conversion_notification(
-                credentials=credentials,
+            # Queue email notification once the response has been sent
+            # (failures are logged by the email service and never fail the request)
+            background_tasks.add_task(
+                send_resume_conversion_notification,
+                claims=claims,
                 resume_link=public_url,
-                conversion_type="json"
+                conversion_type="json",
             )
-            if email_sent:
-                logger.info(f"Email notification sent to user {user_id}")
-            else:
-                logger.warning(f"Failed to send email notification to user {user_id}")
-        except Exception as email_error:
-            logger.error(f"Error sending email notification: {email_error}")
-            # Don't fail the main request if email fails
-
-        # Clean up generated files (PDF, .tex, .aux, .log, .out)
-        base_name, _ = os.path.splitext(pdf_filename)
-        extensions_to_clean = [".pdf", ".tex", ".aux", ".log", ".out"]
-        for ext in extensions_to_clean:
-            file_to_clean_path = os.path.join(latex_output_dir, f"{base_name}{ext}")
-            try:
-                if os.path.isfile(file_to_clean_path):
-                    os.remove(file_to_clean_path)
-                    logger.info(f"Cleaned up file: {file_to_clean_path}")
-            except Exception as cleanup_err:
-                logger.warning(f"Failed to delete {file_to_clean_path}: {cleanup_err}")
-
-        end_time = time.time()
-        processing_time_ms = (end_time - start_time) * 1000
-        logger.info(
-            f"Request /convert-json-to-latex completed in {processing_time_ms:.2f} ms for user {user_id}."
-        )
 
-        # Increment usage counters
-        increment_user_usage(user_id, daily, monthly)
-        daily_log_val = "N/A"
-        if (
-            hasattr(daily, "current_usage")
-            and getattr(daily, "current_usage", None) is not None
-        ):
-            daily_log_val = str(daily.current_usage + 1)
-        elif isinstance(daily, int):
-            daily_log_val = str(daily + 1)
-
-        monthly_log_val = "N/A"
-        if (
-            hasattr(monthly, "current_usage")
-            and getattr(monthly, "current_usage", None) is not None
-        ):
-            monthly_log_val = str(monthly.current_usage + 1)
-        elif isinstance(monthly, int):
-            monthly_log_val = str(monthly + 1)
-        logger.info(
-            f"Incremented usage for user {user_id}. New usage: Daily={daily_log_val}, Monthly={monthly_log_val}"
-        )
+            end_time = time.time()
+            processing_time_ms = (end_time - start_time) * 1000
+            logger.info(
+                "Request /convert-json-to-latex completed in %.2f ms for user %s.",
+                processing_time_ms, user_id
+            )
 
-        return JsonToLatexResponse(resume_link=public_url, pdf_filename=pdf_filename)
+            return JsonToLatexResponse(resume_link=public_url, pdf_filename=pdf_filename)
 
-    except HTTPException as he:
-        logger.error(
-            f"HTTPException in /convert-json-to-latex for user {user_id}: {he.detail}",
-            exc_info=True,
-        )
-        raise he
-    except ValueError as ve:  # For Pydantic validation errors or other value errors
-        logger.error(
-            f"ValueError in /convert-json-to-latex for user {user_id}: {str(ve)}",
-            exc_info=True,
-        )
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
-    except RuntimeError as re:
-        logger.error(
-            f"RuntimeError in /convert-json-to-latex for user {user_id}: {str(re)}",
-            exc_info=True,
-        )
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(re)
-        )
-    except Exception as e:
-        logger.error(
-            f"Unexpected error in /convert-json-to-latex for user {user_id}: {e}",
-            exc_info=True,
-        )
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="An unexpected error occurred during JSON to LaTeX conversion.",
-        )
+        except HTTPException as he:
+            logger.error(
+                "HTTPException in /convert-json-to-latex for user %s: %s",
+                user_id, he.detail,
+                exc_info=True,
+            )
+            raise he
+        except ValueError as ve:  # For Pydantic validation errors or other value errors
+            logger.error(
+                "ValueError in /convert-json-to-latex for user %s: %s", user_id, ve,
+                exc_info=True,
+            )
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+        except RuntimeError as re:
+            logger.error(
+                "RuntimeError in /convert-json-to-latex for user %s: %s", user_id, re,
+                exc_info=True,
+            )
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(re)
+            )
+        except Exception as e:
+            logger.error(
+                "Unexpected error in /convert-json-to-latex for user %s: %s", user_id, e,
+                exc_info=True,
+            )
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="An unexpected error occurred during JSON to LaTeX conversion.",
+            )
 
 
 if __name__ == "__main__":
@@ -487,6 +523,20 @@ if __name__ == "__main__":
     log_level = "info"  # Configure log level here
 
     logger.info(
-        f"Starting Uvicorn server locally on {host}:{port} with log level {log_level}..."
+        "Starting Uvicorn server locally on %s:%s with log level %s...",
+        host, port, log_level
     )
-    uvicorn.run("main:app", host=host, port=port, log_level=log_level, reload=True)
+    if os.environ.get("DEV"):
+        # Auto-reload runs a single process with a file watcher; development only
+        uvicorn.run("main:app", host=host, port=port, log_level=log_level, reload=True)
+    else:
+        uvicorn.run(
+            "main:app",
+            host=host,
+            port=port,
+            log_level=log_level,
+            loop="uvloop",
+            http="httptools",
+            # Exported so each worker sizes its parse pool for this many siblings
+            workers=int(os.environ.setdefault("WEB_CONCURRENCY", str(os.cpu_count() or 1))),
+        )
@@ -32,26 +32,26 @@ async def handle_stripe_webhook(request: Request, stripe_signature: str = Header
         event = stripe.Webhook.construct_event(
             payload, stripe_signature, endpoint_secret
         )
-        logger.info(f"Received valid Stripe webhook event: {event['type']}")
+        logger.info("Received valid Stripe webhook event: %s", event["type"])
     except ValueError as e:
-        logger.error(f"Invalid Stripe webhook payload: {e}")
+        logger.error("Invalid Stripe webhook payload: %s", e)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, 
             detail="Invalid payload"
         )
     except stripe.error.SignatureVerificationError as e:
-        logger.error(f"Invalid Stripe webhook signature: {e}")
+        logger.error("Invalid Stripe webhook signature: %s", e)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, 
             detail="Invalid signature"
         )
     except Exception as e:
-        logger.error(f"Error constructing Stripe event: {e}")
+        logger.error("Error constructing Stripe event: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
             detail="Webhook processing error"
         )
 
     # For now, just log the event type and return success
-    logger.info(f"Webhook event {event['type']} received (processing disabled)")
+    logger.info("Webhook event %s received (processing disabled)", event["type"])
     return {"message": "Webhook received successfully."}
\ No newline at end of file
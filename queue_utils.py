@@ -0,0 +1,84 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWorker:
+    """
+    A bounded queue drained by one background task. The first queued item
+    waits up to window_seconds for others to join its batch (at most max_size
+    items), then the batch is passed to handle_batch. Used by the email and
+    resume insert workers.
+    """
+
+    def __init__(
+        self,
+        handle_batch: Callable[[list], Awaitable[None]],
+        max_size: int,
+        window_seconds: float,
+        queue_max_size: int,
+        label: str,
+    ):
+        self.handle_batch = handle_batch
+        self.max_size = max_size
+        self.window_seconds = window_seconds
+        self.queue_max_size = queue_max_size
+        self.label = label  # Names the queued items in log messages, e.g. "email(s)"
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._queue is not None
+
+    def put_nowait(self, item: Any) -> None:
+        """Queues an item for the next batch. Raises asyncio.QueueFull when the queue is full."""
+        self._queue.put_nowait(item)
+
+    async def _collect_batch(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window_seconds
+        while len(batch) < self.max_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect_batch()
+            try:
+                await self.handle_batch(batch)
+            except Exception as e:
+                logger.error("Failed to process %d %s: %s", len(batch), self.label, e, exc_info=True)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def start(self) -> None:
+        """Create the queue and start the background task (call on app startup)."""
+        self._queue = asyncio.Queue(maxsize=self.queue_max_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Flush queued items (up to timeout seconds) and stop the task (call on app shutdown)."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Timed out flushing %d queued %s", self._queue.qsize(), self.label)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._queue = None
+        self._task = None
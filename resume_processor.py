@@ -1,9 +1,10 @@
 # /backend/resume_processor.py
-import os
+import re
+import asyncio
 import logging
-import datetime
 
 # LangChain imports
+from cachetools import LRUCache
 from langchain_google_vertexai import ChatVertexAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
@@ -15,6 +16,21 @@ from prompts import RESUME_TAILORING_PROMPT, LATEX_CONVERSION_PROMPT, LATEX_TEMP
 
 logger = logging.getLogger(__name__)
 
+# LaTeX that compiled for a resume (e.g. the same JSON resume converted again)
+# is reused from this per-process cache instead of another model call
+LLM_CACHE_MAX_SIZE = 1024
+_latex_cache = LRUCache(maxsize=LLM_CACHE_MAX_SIZE)
+
+# At most this many chain batches run at once; calls arriving meanwhile queue
+# up and leave together (up to LLM_BATCH_MAX_SIZE) when a slot frees
+LLM_BATCH_MAX_SIZE = 8
+LLM_MAX_IN_FLIGHT_BATCHES = 16
+
+# Phrases that show the model asked for input instead of tailoring the resume
+_REFUSAL_RE = re.compile(
+    r"provide the content|ready to help|cannot fulfill|i need the resume", re.IGNORECASE
+)
+
 # --- LangChain Setup Function ---
 
 
@@ -35,21 +51,27 @@ def setup_resume_tailoring_chain(
 
     # # 2. Initialize the model
     try:
-        logger.info(f"Initializing model: {model_name}...")
-        llm = ChatVertexAI(
+        logger.info("Initializing model: %s...", model_name)
+        model_settings = dict(
             model_name=model_name,
             project=None,  # Set Google Cloud project here
             location=None,  # Set Google Cloud location here
             temperature=temperature,
         )
+        # No model-level cache: tailoring samples a new answer on every call, and
+        # LaTeX output is only cached once it has compiled (see cache_latex_resume)
+        llm = ChatVertexAI(**model_settings, cache=False)
         logger.info("Model initialized successfully.")
     except Exception as e:
-        logger.error(f"Error initializing model: {e}", exc_info=True)
+        logger.error("Error initializing model: %s", e, exc_info=True)
         raise RuntimeError(f"Could not initialize model: {e}")
 
     # 4. Create Prompt Templates
     resume_prompt = ChatPromptTemplate.from_template(RESUME_TAILORING_PROMPT)
-    latex_prompt = ChatPromptTemplate.from_template(LATEX_CONVERSION_PROMPT)
+    # The LaTeX template never changes, so it is bound into the prompt once here
+    latex_prompt = ChatPromptTemplate.from_template(LATEX_CONVERSION_PROMPT).partial(
+        latex_template=LATEX_TEMPLATE
+    )
 
     # 5. Define Output Parser
     output_parser = StrOutputParser()
@@ -62,6 +84,98 @@ def setup_resume_tailoring_chain(
     return resume_chain, latex_chain
 
 
+# --- Request Batching ---
+
+
+class BatchedChain:
+    """
+    Drop-in wrapper for a chain's ainvoke that bounds concurrent model calls.
+    A call is dispatched at once while fewer than LLM_MAX_IN_FLIGHT_BATCHES
+    batches are running; otherwise it waits, and the calls that queued up are
+    sent together (up to LLM_BATCH_MAX_SIZE) with a single chain.abatch. With
+    dedupe, identical inputs in a batch share one model call; leave it off for
+    chains whose answers are sampled per request.
+    """
+
+    def __init__(
+        self,
+        chain: RunnableSequence,
+        max_size: int = LLM_BATCH_MAX_SIZE,
+        max_in_flight: int = LLM_MAX_IN_FLIGHT_BATCHES,
+        dedupe: bool = True,
+    ):
+        self.chain = chain
+        self.max_size = max_size
+        self.max_in_flight = max_in_flight
+        self.dedupe = dedupe
+        self._queue: asyncio.Queue | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._collector: asyncio.Task | None = None
+        self._inflight: set[asyncio.Task] = set()
+
+    async def ainvoke(self, inputs: dict):
+        if self._collector is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._collector = asyncio.create_task(self._collect())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((inputs, future))
+        return await future
+
+    async def _collect(self) -> None:
+        while True:
+            await self._slots.acquire()
+            # No waiting window: take whatever has queued by the time a slot is free
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+            task.add_done_callback(lambda _: self._slots.release())
+
+    def _group(self, batch: list) -> list[tuple[dict, list[asyncio.Future]]]:
+        """Groups the batch's futures by input (one group per call without dedupe)."""
+        if not self.dedupe:
+            return [(inputs, [future]) for inputs, future in batch]
+        waiters: dict[tuple, tuple[dict, list[asyncio.Future]]] = {}
+        for inputs, future in batch:
+            key = tuple(sorted(inputs.items()))
+            waiters.setdefault(key, (inputs, []))[1].append(future)
+        return list(waiters.values())
+
+    async def _dispatch(self, batch: list) -> None:
+        # Any failure, including an unhashable input while grouping, is handed
+        # to every caller in the batch so none of them waits forever
+        try:
+            groups = self._group(batch)
+            results = await self.chain.abatch(
+                [inputs for inputs, _ in groups], return_exceptions=True
+            )
+        except Exception as e:
+            groups = [(inputs, [future]) for inputs, future in batch]
+            results = [e] * len(groups)
+        if len(batch) > 1:
+            logger.info("Batched %s chain calls into %s model requests.", len(batch), len(groups))
+        for (_, futures), result in zip(groups, results):
+            for future in futures:
+                if future.done():  # Caller was cancelled
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def aclose(self) -> None:
+        """Stops collecting new batches and cancels calls still in flight."""
+        tasks = [*self._inflight, *([self._collector] if self._collector else [])]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._collector = None
+        self._queue = None
+
+
 # --- Core Tailoring Function ---
 async def generate_tailored_resume(
     resume_content: str, job_description: str, chain: RunnableSequence
@@ -70,7 +184,7 @@ async def generate_tailored_resume(
     Takes original resume text, job description text, and a pre-configured
     LangChain chain, and returns a tailored resume string (asynchronously).
     """
-        logger.info("Processing resume tailoring...")
+    logger.info("Processing resume tailoring...")
     if not resume_content or not job_description:
         logger.error("Attempted to tailor resume with empty content.")
         raise ValueError("Resume content and job description cannot be empty.")
@@ -81,7 +195,7 @@ async def generate_tailored_resume(
             {"resume_content": resume_content, "job_description": job_description}
         )
         logger.info(
-            f"Processing successful (Output length: {len(tailored_resume)})."
+            "Processing successful (Output length: %s).", len(tailored_resume)
         )
 
         if not isinstance(tailored_resume, str) or not tailored_resume.strip():
@@ -90,16 +204,11 @@ async def generate_tailored_resume(
 
         if len(tailored_resume) < 100:  # Arbitrary short length check
             logger.warning(
-                f"Output seems very short ({len(tailored_resume)} chars). Possible error."
+                "Output seems very short (%s chars). Possible error.",
+                len(tailored_resume)
             )
             # Example check for refusal patterns
-            refusal_patterns = [
-                "provide the content",
-                "ready to help",
-                "cannot fulfill",
-                "i need the resume",
-            ]
-            if any(p in tailored_resume.lower() for p in refusal_patterns):
+            if _REFUSAL_RE.search(tailored_resume):
                 logger.error(
                     "Response indicates it didn't process the input correctly."
                 )
@@ -110,12 +219,12 @@ async def generate_tailored_resume(
         return tailored_resume.strip()  # Return stripped text
 
     except OutputParserException as ope:
-        logger.error(f"An error occurred parsing the output: {ope}", exc_info=True)
+        logger.error("An error occurred parsing the output: %s", ope, exc_info=True)
         raise RuntimeError(f"Failed to parse output: {ope}")
     except Exception as e:
         # Catch specific API errors if possible (e.g., RateLimitError, AuthenticationError)
         logger.error(
-            f"An error occurred during LangChain chain invocation: {e}", exc_info=True
+            "An error occurred during LangChain chain invocation: %s", e, exc_info=True
         )
         raise RuntimeError(f"Processing failed: {e}")
 
@@ -130,27 +239,33 @@ async def generate_latex_resume(resume_content: str, chain: RunnableSequence) ->
         logger.error("Attempted to convert empty resume content")
         raise ValueError("Resume content cannot be empty")
 
-    # Define base_dir to save the .tex file
-    base_dir = os.getcwd()  # Configure output directory here
+    cached_latex = _latex_cache.get(resume_content)
+    if cached_latex is not None:
+        logger.info("Reusing compiled LaTeX for identical resume content.")
+        return cached_latex
 
     try:
-        # Use the template from prompts.py instead of reading from file
-        latex_resume = await chain.ainvoke(
-            {"resume_content": resume_content, "latex_template": LATEX_TEMPLATE}
-        )
+        # LATEX_TEMPLATE is already bound into the chain's prompt
+        latex_resume = await chain.ainvoke({"resume_content": resume_content})
 
         # Basic validation
         if not isinstance(latex_resume, str):
             raise RuntimeError("Model output is not a string")
 
         # Only remove markdown code block markers, preserve all LaTeX content
-        if latex_resume.startswith("```latex\n"):
-            latex_resume = latex_resume[8:]  # Remove ```latex\n prefix
-        if latex_resume.endswith("\n```"):
-            latex_resume = latex_resume[:-4]  # Remove ```\n suffix
+        latex_resume = latex_resume.removeprefix("```latex\n").removesuffix("\n```")
 
         return latex_resume
 
     except Exception as e:
-        logger.error(f"Error during LaTeX conversion: {e}", exc_info=True)
+        logger.error("Error during LaTeX conversion: %s", e, exc_info=True)
         raise RuntimeError(f"LaTeX conversion failed: {e}")
+
+
+def cache_latex_resume(resume_content: str, latex_resume: str) -> None:
+    """
+    Remembers LaTeX for resume_content so generate_latex_resume can reuse it.
+    Call only after the LaTeX compiled: output that fails pdflatex is never
+    cached, so a retry with the same input asks the model again.
+    """
+    _latex_cache[resume_content] = latex_resume
@@ -1,58 +1,147 @@
-from supabase import create_client, Client
+import io
+import asyncio
+import logging
+from contextlib import ExitStack
+from typing import BinaryIO, Union
+from clients import get_supabase
+from queue_utils import BatchWorker
 
-# Configure Supabase credentials here
-SUPABASE_URL = None  # Set Supabase URL here
-SUPABASE_KEY = None  # Set Supabase key here
+logger = logging.getLogger(__name__)
+
+# Configure Supabase storage here
 SUPABASE_BUCKET = None  # Set Supabase bucket name here
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# resume_table inserts are queued and written by a single background worker,
+# one multi-row INSERT per batch instead of one round trip per resume.
+RESUME_INSERT_BATCH_WINDOW_SECONDS = 0.1
+RESUME_INSERT_BATCH_MAX_SIZE = 50
+RESUME_INSERT_QUEUE_MAX_SIZE = 1000
+# A failed batch is retried, then inserted row by row so one bad row only loses itself
+RESUME_INSERT_RETRIES = 2
+RESUME_INSERT_RETRY_DELAY_SECONDS = 0.5
 
-def upload_pdf_to_bucket(file_path: str, dest_filename: str) -> str:
+async def upload_pdf_to_bucket(pdf: Union[str, bytes, bytearray, memoryview, BinaryIO], dest_filename: str) -> str:
     """
-    Uploads a PDF file to the Supabase storage bucket and returns the public URL.
+    Uploads a PDF to the Supabase storage bucket and returns the public URL.
+    The PDF may be a local file path, the PDF bytes, or an open binary file.
+    Paths, bytes and files from open() are sent without an extra copy;
+    bytearray/memoryview are copied into bytes and other file objects (BytesIO,
+    SpooledTemporaryFile, ...) are read whole, as storage3 only accepts
+    bytes, BufferedReader or FileIO as content.
     """
     try:
-        with open(file_path, "rb") as f:
+        supabase = await get_supabase()
+        bucket = supabase.storage.from_(SUPABASE_BUCKET)
+        # Paths are passed on as an open handle, not read into bytes: httpx
+        # streams file objects into the multipart body in 64 KiB reads, so the
+        # PDF is never held in memory whole (a path handed to storage3 would
+        # also be opened there and never closed)
+        with ExitStack() as stack:
+            if isinstance(pdf, str):
+                body = stack.enter_context(open(pdf, "rb"))
+            elif isinstance(pdf, (bytes, io.BufferedReader, io.FileIO)):
+                body = pdf
+            elif isinstance(pdf, (bytearray, memoryview)):
+                body = bytes(pdf)
+            else:
+                body = pdf.read()
             # The upload method returns an object or raises an exception if it fails
-            supabase.storage.from_(SUPABASE_BUCKET).upload(
+            await bucket.upload(
                 dest_filename, 
-                f, 
+                body, 
                 file_options={"content-type": "application/pdf"},
             )
         
         # If we reached here, the upload was successful
         # Get public URL
-        public_url = supabase.storage.from_(SUPABASE_BUCKET).get_public_url(dest_filename)
+        public_url = await bucket.get_public_url(dest_filename)
         return public_url
     except Exception as e:
-        print(f"Upload error details: {str(e)}")
+        logger.error("Upload error details: %s", e)
         raise
 
-def insert_resume_record(resume_link: str, user_id: str):
+async def _insert_resume_rows(rows: list[dict]):
+    """Inserts one or more rows into resume_table in a single request."""
+    supabase = await get_supabase()
+    return await supabase.table("resume_table").insert(rows).execute()
+
+async def insert_resume_record(resume_link: str, user_id: str):
     """
     Inserts a new record into the resume_table with the given resume_link and user_id.
+    When the insert worker is running the row is queued and written with the
+    next batch; otherwise (or if the queue is full) it is inserted directly.
     """
-    from datetime import datetime
-    import uuid
+    # id and created_at are filled in by the table defaults (see README)
     data = {
-        "id": str(uuid.uuid4()),
-        "created_at": datetime.utcnow().isoformat(),
         "resume_link": resume_link,
         "user_id": user_id
     }
+    if _insert_worker.running:
+        try:
+            _insert_worker.put_nowait(data)
+            return None
+        except asyncio.QueueFull:
+            logger.warning("Resume insert queue is full; inserting record for %s directly", user_id)
     try:
-        response = supabase.table("resume_table").insert(data).execute()
-        return response
+        return await _insert_resume_rows([data])
     except Exception as e:
-        print(f"Insert error details: {str(e)}")
+        logger.error("Insert error details: %s", e)
         raise
 
+async def _flush_insert_batch(batch: list[dict]) -> None:
+    """
+    Inserts a batch, retrying transient failures with a growing delay. If the
+    batch still fails, each row is inserted on its own so only rows that fail
+    individually are lost (and logged).
+    """
+    for attempt in range(RESUME_INSERT_RETRIES + 1):
+        try:
+            await _insert_resume_rows(batch)
+            logger.info("Inserted %d resume record(s)", len(batch))
+            return
+        except Exception as e:
+            logger.warning(
+                "Failed to insert %d resume record(s) (attempt %d): %s", len(batch), attempt + 1, e
+            )
+            if attempt < RESUME_INSERT_RETRIES:
+                await asyncio.sleep(RESUME_INSERT_RETRY_DELAY_SECONDS * (attempt + 1))
+
+    if len(batch) == 1:
+        row = batch[0]
+        logger.error("Dropping resume record for user %s: %s", row["user_id"], row["resume_link"])
+        return
+    for row in batch:
+        try:
+            await _insert_resume_rows([row])
+        except Exception as e:
+            logger.error(
+                "Dropping resume record for user %s (%s): %s", row["user_id"], row["resume_link"], e
+            )
+
+# Drains queued rows in batches of up to RESUME_INSERT_BATCH_MAX_SIZE collected
+# over RESUME_INSERT_BATCH_WINDOW_SECONDS
+_insert_worker = BatchWorker(
+    _flush_insert_batch,
+    max_size=RESUME_INSERT_BATCH_MAX_SIZE,
+    window_seconds=RESUME_INSERT_BATCH_WINDOW_SECONDS,
+    queue_max_size=RESUME_INSERT_QUEUE_MAX_SIZE,
+    label="resume record(s)",
+)
+
+def start_insert_worker() -> None:
+    """Create the insert queue and start the background worker (call on app startup)."""
+    _insert_worker.start()
+
+async def stop_insert_worker(timeout: float = 10.0) -> None:
+    """Flush pending inserts (up to timeout seconds) and stop the worker (call on app shutdown)."""
+    await _insert_worker.stop(timeout)
+
 if __name__ == "__main__":
     # Example usage
     file_path = "latex_output/7d1f0007-63e1-4e1a-b22b-54c4d836d628.pdf"  # Path to your PDF file
     dest_filename = f"{file_path}"  # Destination filename in the bucket
     try:
-        public_url = upload_pdf_to_bucket(file_path, dest_filename)
+        public_url = asyncio.run(upload_pdf_to_bucket(file_path, dest_filename))
         print(f"PDF uploaded successfully! Public URL: {public_url}")
     except Exception as e:
         print(f"Error uploading PDF: {str(e)}")
\ No newline at end of file
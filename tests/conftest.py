@@ -0,0 +1,18 @@
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+import resume_processor
+
+
+def _offline_chains(model_name=None):
+    """Stands in for the Vertex AI chains, which need a configured model and credentials."""
+    return RunnableLambda(lambda inputs: ""), RunnableLambda(lambda inputs: "")
+
+
+@pytest.fixture(scope="session")
+def main_module():
+    """The real main module, imported with offline model chains."""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(resume_processor, "setup_resume_tailoring_chain", _offline_chains)
+        import main
+    return main
@@ -0,0 +1,84 @@
+import base64
+import hashlib
+import hmac
+import time
+
+import jwt
+import orjson
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+import auth_utils
+
+KEY = b"test-signing-secret-long-enough-for-hs256-and-hs384"
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _token(claims, headers=None, key=KEY, algorithm="HS256"):
+    return jwt.encode(claims, key, algorithm=algorithm, headers=headers)
+
+
+def _raw_token(header, payload, key=KEY):
+    """Builds an HS256-signed token from arbitrary JSON values, bypassing PyJWT's checks."""
+    signing_input = f"{_b64(orjson.dumps(header))}.{_b64(orjson.dumps(payload))}"
+    signature = hmac.new(key, signing_input.encode("ascii"), hashlib.sha256).digest()
+    return f"{signing_input}.{_b64(signature)}"
+
+
+def _pyjwt_decode(token):
+    return jwt.decode(
+        token, KEY, algorithms=["HS256"], options={"verify_aud": False, "require": ["sub", "exp"]}
+    )
+
+
+def _outcome(decode, token):
+    try:
+        return decode(token)
+    except jwt.ExpiredSignatureError:
+        return "expired"
+    except jwt.PyJWTError:
+        return "invalid"
+
+
+NOW = int(time.time())
+VALID = {"sub": "user-1", "exp": NOW + 600, "email": "a@example.com"}
+
+CASES = {
+    "valid": _token(VALID),
+    "valid_with_past_nbf_and_iat": _token({**VALID, "nbf": NOW - 10, "iat": NOW - 10}),
+    "bad_signature": _token(VALID, key=b"another-signing-secret-long-enough-for-hs256-hs384"),
+    "wrong_alg_hs384": _token(VALID, algorithm="HS384"),
+    "alg_none": _raw_token({"alg": "none", "typ": "JWT"}, VALID),
+    "missing_sub": _token({"exp": NOW + 600}),
+    "missing_exp": _token({"sub": "user-1"}),
+    "expired": _token({**VALID, "exp": NOW - 10}),
+    "future_nbf": _token({**VALID, "nbf": NOW + 600}),
+    "future_iat": _token({**VALID, "iat": NOW + 600}),
+    "non_numeric_exp": _raw_token({"alg": "HS256"}, {**VALID, "exp": "soon"}),
+    "payload_not_object": _raw_token({"alg": "HS256"}, ["sub", "exp"]),
+    "two_segments": ".".join(_token(VALID).split(".")[:2]),
+    "four_segments": _token(VALID) + ".extra",
+    "bad_base64": "!!!." + _token(VALID).split(".", 1)[1],
+    "header_not_json": _b64(b"not json") + "." + _token(VALID).split(".", 1)[1],
+}
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_decode_hs256_matches_pyjwt(name):
+    token = CASES[name]
+    assert _outcome(lambda t: auth_utils._decode_hs256(t, KEY), token) == _outcome(_pyjwt_decode, token)
+
+
+def test_jwks_only_config_rejects_hs256_token_with_401(monkeypatch):
+    monkeypatch.setattr(auth_utils, "_SIGNING_KEY", None)
+    monkeypatch.setattr(auth_utils, "_JWKS_CLIENT", object())
+    monkeypatch.setattr(auth_utils, "_JWT_CONFIGURED", True)
+    auth_utils._jwt_claims_cache.clear()
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=_token(VALID))
+    with pytest.raises(HTTPException) as exc_info:
+        auth_utils.get_jwt_claims(credentials)
+    assert exc_info.value.status_code == 401
@@ -0,0 +1,28 @@
+from fastapi.testclient import TestClient
+
+
+def _chunked(total_size, chunk_size=1024 * 1024):
+    """Yields a body without a Content-Length, so it is sent chunked."""
+    for offset in range(0, total_size, chunk_size):
+        yield b"x" * min(chunk_size, total_size - offset)
+
+
+def test_declared_oversized_body_is_rejected(main_module):
+    client = TestClient(main_module.app)
+    response = client.post(
+        "/tailor",
+        content=b"x" * (main_module.MAX_REQUEST_BODY_SIZE + 1),
+        headers={"Content-Type": "multipart/form-data; boundary=x"},
+    )
+    assert response.status_code == 413
+
+
+def test_chunked_oversized_body_is_cut_off(main_module):
+    client = TestClient(main_module.app)
+    response = client.post(
+        "/tailor",
+        content=_chunked(main_module.MAX_REQUEST_BODY_SIZE * 2),
+        headers={"Content-Type": "multipart/form-data; boundary=x"},
+    )
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Request body too large."}
@@ -0,0 +1,34 @@
+import asyncio
+
+from queue_utils import BatchWorker
+
+
+def _drain(items, max_size, fail_first=False):
+    """Queues items on a worker, stops it and returns the batches it handled."""
+    batches = []
+
+    async def handle_batch(batch):
+        batches.append(batch)
+        if fail_first and len(batches) == 1:
+            raise RuntimeError("flush failed")
+
+    async def scenario():
+        worker = BatchWorker(
+            handle_batch, max_size=max_size, window_seconds=0.01, queue_max_size=100, label="item(s)"
+        )
+        worker.start()
+        for item in items:
+            worker.put_nowait(item)
+        await worker.stop(timeout=1)
+        assert not worker.running
+
+    asyncio.run(scenario())
+    return batches
+
+
+def test_queued_items_are_flushed_in_batches_of_max_size():
+    assert _drain(range(7), max_size=3) == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_failed_batch_does_not_stop_the_worker():
+    assert _drain(range(4), max_size=2, fail_first=True) == [[0, 1], [2, 3]]
@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+import resume_processor
+from resume_processor import BatchedChain, cache_latex_resume, generate_latex_resume
+
+
+class FakeChain:
+    """Records each abatch call and echoes inputs back (or raises on "fail")."""
+
+    def __init__(self):
+        self.batches = []
+        self.release = asyncio.Event()
+
+    async def abatch(self, inputs, return_exceptions=False):
+        self.batches.append(inputs)
+        await self.release.wait()
+        return [
+            ValueError("model failed") if item.get("text") == "fail" else f"out:{item['text']}"
+            for item in inputs
+        ]
+
+
+async def _run(chain, calls, **options):
+    """Sends the first call, then queues the rest while it is still in flight."""
+    batched = BatchedChain(chain, **options)
+    tasks = [asyncio.create_task(batched.ainvoke(calls[0]))]
+    while not chain.batches:
+        await asyncio.sleep(0)
+    tasks += [asyncio.create_task(batched.ainvoke(inputs)) for inputs in calls[1:]]
+    await asyncio.sleep(0)
+    chain.release.set()
+    try:
+        return await asyncio.wait_for(
+            asyncio.gather(*tasks, return_exceptions=True), timeout=1
+        )
+    finally:
+        await batched.aclose()
+
+
+def test_queued_calls_are_sent_together():
+    chain = FakeChain()
+    results = asyncio.run(
+        _run(chain, [{"text": str(i)} for i in range(5)], max_size=3, max_in_flight=1)
+    )
+    assert results == [f"out:{i}" for i in range(5)]
+    assert [len(batch) for batch in chain.batches] == [1, 3, 1]
+
+
+def test_identical_inputs_share_one_call_with_dedupe():
+    chain = FakeChain()
+    results = asyncio.run(_run(chain, [{"text": "a"}] * 3 + [{"text": "b"}], max_in_flight=1))
+    assert results == ["out:a", "out:a", "out:a", "out:b"]
+    assert chain.batches == [[{"text": "a"}], [{"text": "a"}, {"text": "b"}]]
+
+
+def test_identical_inputs_are_sent_separately_without_dedupe():
+    chain = FakeChain()
+    asyncio.run(_run(chain, [{"text": "a"}] * 3, max_in_flight=1, dedupe=False))
+    assert [len(batch) for batch in chain.batches] == [1, 2]
+
+
+def test_failed_call_only_fails_its_own_callers():
+    chain = FakeChain()
+    results = asyncio.run(_run(chain, [{"text": "ok"}, {"text": "fail"}]))
+    assert results[0] == "out:ok"
+    assert isinstance(results[1], ValueError)
+
+
+def test_grouping_error_reaches_every_caller():
+    chain = FakeChain()
+    calls = [{"text": "slow"}, {"text": ["unhashable"]}, {"text": "b"}]
+    results = asyncio.run(_run(chain, calls, max_in_flight=1))
+    assert results[0] == "out:slow"
+    assert all(isinstance(result, TypeError) for result in results[1:])
+
+
+def test_chain_error_reaches_every_caller():
+    class BrokenChain(FakeChain):
+        async def abatch(self, inputs, return_exceptions=False):
+            self.batches.append(inputs)
+            raise RuntimeError("quota exceeded")
+
+    results = asyncio.run(_run(BrokenChain(), [{"text": "a"}, {"text": "b"}]))
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+@pytest.mark.parametrize("dedupe", [True, False])
+def test_cancelled_caller_does_not_block_others(dedupe):
+    async def scenario():
+        chain = FakeChain()
+        batched = BatchedChain(chain, max_in_flight=1, dedupe=dedupe)
+        first = asyncio.create_task(batched.ainvoke({"text": "a"}))
+        second = asyncio.create_task(batched.ainvoke({"text": "b"}))
+        while not chain.batches:
+            await asyncio.sleep(0)
+        first.cancel()
+        chain.release.set()
+        try:
+            return await asyncio.wait_for(second, timeout=1)
+        finally:
+            await batched.aclose()
+
+    assert asyncio.run(scenario()) == "out:b"
+
+
+class CountingChain:
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, inputs):
+        self.calls += 1
+        return f"\\section{{{inputs['resume_content']}}} % {self.calls}"
+
+
+def test_latex_is_reused_only_after_it_compiled(monkeypatch):
+    monkeypatch.setattr(resume_processor, "_latex_cache", {})
+    chain = CountingChain()
+    first = asyncio.run(generate_latex_resume("resume", chain))
+    # Not compiled yet (e.g. pdflatex failed): a retry asks the model again
+    second = asyncio.run(generate_latex_resume("resume", chain))
+    assert chain.calls == 2 and first != second
+
+    cache_latex_resume("resume", second)
+    assert asyncio.run(generate_latex_resume("resume", chain)) == second
+    assert chain.calls == 2
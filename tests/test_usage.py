@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from langchain_core.runnables import RunnableLambda
+
+import usage
+from auth_utils import get_jwt_claims, get_user_id_from_jwt
+
+
+class FakeRpc:
+    def __init__(self, calls, name, data):
+        self.calls = calls
+        self.name = name
+        self.data = data
+
+    async def execute(self):
+        self.calls.append(self.name)
+        return type("Result", (), {"data": self.data})()
+
+
+class FakeSupabase:
+    def __init__(self, allowed=True):
+        self.calls = []
+        self.allowed = allowed
+
+    def rpc(self, name, params):
+        data = [{"daily": 1, "monthly": 1, "allowed": self.allowed}]
+        return FakeRpc(self.calls, "reserve" if name == "check_and_increment_usage" else "refund", data)
+
+
+@pytest.fixture
+def supabase(monkeypatch):
+    fake = FakeSupabase()
+
+    async def get_supabase():
+        return fake
+
+    monkeypatch.setattr(usage, "get_supabase", get_supabase)
+    usage._limit_reached_cache.clear()
+    return fake
+
+
+async def _use(user_id, fail):
+    async with usage.reserved_usage(user_id):
+        if fail:
+            raise RuntimeError("boom")
+
+
+def test_reserved_usage_keeps_conversion_on_success(supabase):
+    asyncio.run(_use("user-1", fail=False))
+    assert supabase.calls == ["reserve"]
+
+
+def test_reserved_usage_refunds_when_block_raises(supabase):
+    with pytest.raises(RuntimeError):
+        asyncio.run(_use("user-1", fail=True))
+    assert supabase.calls == ["reserve", "refund"]
+
+
+def test_reserved_usage_rejects_over_limit_without_refund(supabase):
+    supabase.allowed = False
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(_use("user-1", fail=False))
+    assert exc_info.value.status_code == 429
+    assert supabase.calls == ["reserve"]
+
+
+JOB_DESCRIPTION = "Backend engineer building Python APIs with FastAPI and Postgres. " * 2
+RESUME = ("resume.txt", b"Jane Doe - Python developer with five years of API experience.", "text/plain")
+
+
+@pytest.fixture
+def client(main_module, supabase, monkeypatch):
+    """The real app, authenticated as user-1 and using the fake Supabase client."""
+    monkeypatch.setitem(main_module.app.dependency_overrides, get_user_id_from_jwt, lambda: "user-1")
+    monkeypatch.setitem(main_module.app.dependency_overrides, get_jwt_claims, lambda: {"sub": "user-1"})
+    return TestClient(main_module.app, raise_server_exceptions=False)
+
+
+def test_validation_error_is_not_charged(client, supabase):
+    response = client.post("/tailor", data={"job_description": "too short"}, files={"resume_file": RESUME})
+    assert response.status_code == 422
+    assert supabase.calls == []
+
+
+def test_invalid_json_body_is_not_charged(client, supabase):
+    response = client.post("/convert-json-to-latex", json={"unexpected": "shape"})
+    assert response.status_code == 422
+    assert supabase.calls == []
+
+
+def test_successful_request_keeps_the_charge(client, supabase, main_module, monkeypatch):
+    tailored = "Jane Doe - Python API developer. " * 10
+    monkeypatch.setattr(main_module, "resume_tailoring_chain", RunnableLambda(lambda inputs: tailored))
+    response = client.post("/tailor", data={"job_description": JOB_DESCRIPTION}, files={"resume_file": RESUME})
+    assert response.status_code == 200
+    assert response.json()["tailored_resume_text"] == tailored.strip()
+    assert supabase.calls == ["reserve"]
+
+
+def test_failed_request_is_refunded(client, supabase):
+    # The offline tailoring chain returns no text, so tailoring fails with a 500
+    response = client.post("/tailor", data={"job_description": JOB_DESCRIPTION}, files={"resume_file": RESUME})
+    assert response.status_code == 500
+    assert supabase.calls == ["reserve", "refund"]
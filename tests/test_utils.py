@@ -0,0 +1,28 @@
+from pathlib import Path
+
+import pytest
+
+import utils
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def test_parse_doc_reads_compressed_and_unicode_pieces():
+    # resume.doc: a cp1252 (compressed) piece, a UTF-16 piece and a compressed
+    # piece holding a HYPERLINK field and table cell marks
+    text = utils._parse_doc((FIXTURES / "resume.doc").read_bytes(), "resume.doc")
+    assert text == (
+        "Jane Doe\n"
+        "Senior Engineer – Café Team\n"
+        "Languages: Deutsch (über), 日本語 ✓\n"
+        "Portfolio: example.com/jane\n"
+        "Skills:\tPython\t\n"
+    )
+
+
+def test_read_doc_text_rejects_non_word_files():
+    content = bytearray((FIXTURES / "resume.doc").read_bytes())
+    # WordDocument starts after the header, FAT and directory sectors; clear its wIdent
+    content[3 * 512:3 * 512 + 2] = b"\0\0"
+    with pytest.raises(ValueError, match="not a Word binary document"):
+        utils._read_doc_text(bytes(content))
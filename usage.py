@@ -1,42 +1,101 @@
-from supabase import create_client, Client
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator
+from cachetools import TTLCache
 from fastapi import HTTPException, status
+from clients import get_supabase
 
-# Configure Supabase credentials here
-SUPABASE_URL = None  # Set Supabase URL here
-SUPABASE_KEY = None  # Set Supabase key here
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+logger = logging.getLogger(__name__)
 
-def check_user_usage_limits(user_id: str):
+DAILY_CONVERSION_LIMIT = 3
+MONTHLY_CONVERSION_LIMIT = 30
+
+# Users who hit a limit are turned away from memory for a short while instead of
+# calling check_and_increment_usage again on every retry
+LIMIT_REACHED_TTL_SECONDS = 60
+_limit_reached_cache = TTLCache(maxsize=10_000, ttl=LIMIT_REACHED_TTL_SECONDS)
+
+
+@dataclass(slots=True)
+class UsageSnapshot:
+    """A user's conversion count for one period, alongside that period's limit."""
+    current: int
+    limit: int
+
+async def reserve_user_usage(user_id: str) -> tuple[UsageSnapshot, UsageSnapshot]:
+    """
+    Atomically checks the user's limits and counts one conversion.
+    The check_and_increment_usage Postgres function only increments while both
+    counters are under their limits, so one round trip decides and records the
+    conversion and concurrent requests cannot both slip past a limit.
+    Returns the counts including this conversion.
+    """
+    limit_detail = _limit_reached_cache.get(user_id)
+    if limit_detail is not None:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=limit_detail)
     try:
-        usage_data = (
-            supabase.table("user_usage")
-            .select("daily_conversions", "monthly_conversions")
-            .eq("user_id", user_id)
-            .maybe_single()
-            .execute()
-        )
-        # Handle None result
-        data = (usage_data.data if usage_data is not None else {}) or {}
-        daily = data.get("daily_conversions", 0)
-        monthly = data.get("monthly_conversions", 0)
-        if daily >= 3:
-            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Daily conversion limit reached.")
-        if monthly >= 30:
-            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Monthly conversion limit reached.")
-        return daily, monthly
+        supabase = await get_supabase()
+        result = await supabase.rpc(
+            "check_and_increment_usage",
+            {"uid": user_id, "daily_limit": DAILY_CONVERSION_LIMIT, "monthly_limit": MONTHLY_CONVERSION_LIMIT},
+        ).execute()
+        data = (result.data or [{}])[0]
+        daily = data.get("daily", 0)
+        monthly = data.get("monthly", 0)
+        if not data.get("allowed", True):
+            if daily >= DAILY_CONVERSION_LIMIT:
+                limit_detail = "Daily conversion limit reached."
+            else:
+                limit_detail = "Monthly conversion limit reached."
+            _limit_reached_cache[user_id] = limit_detail
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=limit_detail)
+        return UsageSnapshot(daily, DAILY_CONVERSION_LIMIT), UsageSnapshot(monthly, MONTHLY_CONVERSION_LIMIT)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Usage check failed: {str(e)}")
 
-def increment_user_usage(user_id: str, daily: int, monthly: int):
+async def refund_user_usage(user_id: str):
+    """
+    Gives back a conversion reserved by reserve_user_usage when the request
+    that reserved it fails.
+    """
+    # The refund may bring the user back under a limit
+    _limit_reached_cache.pop(user_id, None)
     try:
-        new_daily = daily + 1
-        new_monthly = monthly + 1
-        supabase.table("user_usage").update({
-            "daily_conversions": new_daily,
-            "monthly_conversions": new_monthly
-        }).eq("user_id", user_id).execute()
+        supabase = await get_supabase()
+        await supabase.rpc("refund_user_usage", {"uid": user_id}).execute()
     except Exception as e:
-        # Log but don't block response
-        print(f"Failed to increment usage counters: {e}")
+        # Log but don't mask the original failure
+        logger.error("Failed to refund usage for user %s: %s", user_id, e)
+
+@asynccontextmanager
+async def reserved_usage(user_id: str) -> AsyncIterator[tuple[UsageSnapshot, UsageSnapshot]]:
+    """
+    Reserves one conversion for the body of the block, raising 429 once a limit
+    is reached, and refunds it if the block raises. Metered endpoints enter it
+    inside the handler, so requests rejected by validation are never charged.
+    Yields (daily, monthly).
+    """
+    daily, monthly = await reserve_user_usage(user_id)
+    logger.info(
+        "User usage: Daily=%s/%s, Monthly=%s/%s",
+        daily.current, daily.limit, monthly.current, monthly.limit
+    )
+    try:
+        yield daily, monthly
+    except Exception:
+        await refund_user_usage(user_id)
+        raise
+
+async def increment_user_usage_batch(user_ids: list[str]):
+    """
+    Increments usage for many users in one round trip via the
+    increment_user_usage_batch Postgres function. Repeated ids are
+    counted once per occurrence.
+    """
+    if not user_ids:
+        return None
+    supabase = await get_supabase()
+    return await supabase.rpc("increment_user_usage_batch", {"uids": list(user_ids)}).execute()
@@ -1,17 +1,81 @@
 # /backend/utils.py
 import io
+import os
+import re
+import struct
+import asyncio
 import logging
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
 from fastapi import UploadFile, HTTPException
 
 # File parsing imports
 import docx # python-docx
 import fitz  # PyMuPDF for PDF extraction
+import numpy as np
+import olefile  # Legacy .doc (OLE compound file) extraction
 
 logger = logging.getLogger(__name__)
 
+MAX_FILE_SIZE = 10 * 1024 * 1024  # Reject uploads larger than 10MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# PDF/DOCX parsing is CPU-bound, so it runs in worker processes: on the event
+# loop it stalls every request, and in a thread it still holds the GIL.
+_parse_pool: Optional[ProcessPoolExecutor] = None
+
+
+class FileParseError(Exception):
+    """Raised by parse_resume_bytes with the HTTP status and detail to report.
+    Unlike HTTPException it survives pickling back from a pool worker."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _parse_pool_size() -> int:
+    """
+    Every uvicorn worker starts its own pool, so the CPUs are split between
+    the WEB_CONCURRENCY workers (uvicorn's default for --workers).
+    """
+    workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def start_parse_pool() -> None:
+    """Start the file parsing process pool (call on app startup)."""
+    global _parse_pool
+    # Pool processes come from a clean forkserver rather than being forked from
+    # this process, whose event loop and AnyIO threads may be holding locks
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([__name__])
+    _parse_pool = ProcessPoolExecutor(max_workers=_parse_pool_size(), mp_context=context)
+
+
+def stop_parse_pool() -> None:
+    """Shut down the file parsing process pool (call on app shutdown)."""
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(cancel_futures=True)
+        _parse_pool = None
+
+
+def _replace_broken_parse_pool(broken: ProcessPoolExecutor) -> None:
+    """Swaps in a fresh pool after a worker died, unless another request already did."""
+    if _parse_pool is broken:
+        broken.shutdown(wait=False, cancel_futures=True)
+        start_parse_pool()
+
+
 async def extract_text_from_file(file: UploadFile) -> str:
     """
     Extracts text and hyperlinks from UploadFile (PDF, DOCX, MD/TXT).
+    Parsing runs in the process pool when it has been started.
 
     Args:
         file: The uploaded file object from FastAPI.
@@ -24,124 +88,271 @@ async def extract_text_from_file(file: UploadFile) -> str:
     """
     filename = file.filename or "unknown_file"
     content_type = file.content_type
-    logger.info(f"Attempting to extract text from file: {filename} (Type: {content_type})")
+    logger.debug("Attempting to extract text from file: %s (Type: %s)", filename, content_type)
 
-    # Limit file size (e.g., 10MB) - Optional but recommended
-    MAX_FILE_SIZE = 10 * 1024 * 1024
-    content = await file.read()  # Read file content async
-    size = len(content)
-    if size > MAX_FILE_SIZE:
-        raise HTTPException(status_code=413, detail=f"File size exceeds limit ({MAX_FILE_SIZE / 1024 / 1024} MB).")
-    await file.seek(0) # Go back to start if you need to re-read
+    # Read the upload in chunks, rejecting it as soon as it passes MAX_FILE_SIZE
+    content = bytearray()
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        content += chunk
+        if len(content) > MAX_FILE_SIZE:
+            raise HTTPException(status_code=413, detail=f"File size exceeds limit ({MAX_FILE_SIZE / 1024 / 1024} MB).")
 
+    pool = _parse_pool
     try:
-        content = await file.read() # Read file content async
-        if not content:
-             logger.warning(f"File {filename} appears to be empty.")
-             # Decide if empty file is error or just returns empty string
-             raise HTTPException(status_code=400, detail="Uploaded file is empty.")
+        if pool is None:
+            return parse_resume_bytes(bytes(content), filename, content_type)
+        return await asyncio.get_running_loop().run_in_executor(
+            pool, parse_resume_bytes, bytes(content), filename, content_type
+        )
+    except FileParseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except BrokenProcessPool:
+        # A worker crashed (e.g. a MuPDF segfault or the OOM killer); without a
+        # new pool every later upload in this process would fail too
+        logger.error("Parse worker died while parsing %s; restarting the parse pool.", filename)
+        _replace_broken_parse_pool(pool)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing file {filename}. Please try again or contact support.",
+        )
 
-        text = ""
-        hyperlinks = []
-        if content_type == 'application/pdf' or filename.lower().endswith(".pdf"):
-            try:
-                with io.BytesIO(content) as pdf_file:
-                    pdf_file.seek(0)
-                    doc = fitz.open(stream=pdf_file.read(), filetype="pdf")
-                    for page_num in range(len(doc)):
-                        page = doc[page_num]
-                        # Extract text
-                        text += page.get_text("text") + "\n"
-                        # Extract hyperlinks
-                        links = page.get_links()
-                        for link in links:
-                            if link.get("uri"):
-                                rect = link.get("from")
-                                link_text = ""
-                                if rect:
-                                    words = page.get_text("words")
-                                    for w in words:
-                                        x0, y0, x1, y1, word = w[:5]
-                                        if x0 >= rect.x0 and x1 <= rect.x1 and y0 >= rect.y0 and y1 <= rect.y1:
-                                            link_text += word + " "
-                                    link_text = link_text.strip()
-                                hyperlinks.append(f"Page {page_num + 1}: '{link_text}' -> {link['uri']}")
-            except Exception as pdf_err:
-                logger.error(f"Error reading PDF content from {filename}: {pdf_err}", exc_info=True)
-                raise HTTPException(status_code=400, detail=f"Could not parse PDF file: {pdf_err}")
-            logger.info(f"Successfully extracted {len(text)} characters and {len(hyperlinks)} hyperlinks from PDF: {filename}")
-            if hyperlinks:
-                text += "\n\nHyperlinks found in PDF:\n" + "\n".join(hyperlinks)
-            return text
-
-
-        elif content_type in [
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'application/msword'
-        ] or filename.lower().endswith((".docx", ".doc")):
-            # Handle both DOCX and DOC
-            try:
-                if filename.lower().endswith(".docx"):
-                    with io.BytesIO(content) as docx_file:
-                        document = docx.Document(docx_file)
-                        for para in document.paragraphs:
-                            text += para.text + "\n"
-                else:
-                    # For .doc files, try using textract if available
-                    import subprocess
-                    import tempfile
-                    with tempfile.NamedTemporaryFile(delete=True, suffix='.doc') as tmp:
-                        tmp.write(content)
-                        tmp.flush()
-                        try:
-                            # Try textract first
-                            import textract
-                            extracted = textract.process(tmp.name)
-                            text += extracted.decode('utf-8', errors='replace')
-                        except ImportError:
-                            # Fallback to antiword if textract is not installed
-                            try:
-                                result = subprocess.run([
-                                    'antiword', tmp.name
-                                ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-                                text += result.stdout.decode('utf-8', errors='replace')
-                            except Exception as antiword_err:
-                                logger.error(f"Error using antiword for DOC file {filename}: {antiword_err}", exc_info=True)
-                                raise HTTPException(status_code=400, detail=f"Could not parse DOC file: {antiword_err}")
-            except Exception as doc_err:
-                logger.error(f"Error reading Word content from {filename}: {doc_err}", exc_info=True)
-                raise HTTPException(status_code=400, detail=f"Could not parse Word file: {doc_err}")
-            logger.info(f"Successfully extracted {len(text)} characters from Word file: {filename}")
-            return text
-
-
-        elif content_type in ['text/markdown', 'text/plain'] or filename.lower().endswith((".md", ".txt")):
-             try:
-                 # Try decoding as UTF-8, add fallback if needed
-                 text = content.decode('utf-8')
-             except UnicodeDecodeError:
-                 try:
-                     # Fallback to latin-1 or another common encoding if UTF-8 fails
-                     logger.warning(f"UTF-8 decoding failed for {filename}, trying latin-1.")
-                     text = content.decode('latin-1')
-                 except Exception as decode_err:
-                     logger.error(f"Failed to decode text file {filename}: {decode_err}", exc_info=True)
-                     raise HTTPException(status_code=400, detail="Could not decode text file. Ensure it's UTF-8 encoded.")
-             logger.info(f"Successfully extracted {len(text)} characters from Text/Markdown: {filename}")
-             return text
 
+def _parse_pdf(content: bytes, filename: str) -> str:
+    """Extracts page text and hyperlinks from PDF bytes."""
+    # Page texts are collected and joined once instead of growing one string
+    text_parts = []
+    hyperlinks = []
+    try:
+        # Close the document as soon as parsing ends rather than at garbage collection
+        with fitz.open(stream=content, filetype="pdf") as doc:
+            for page_num in range(len(doc)):
+                page = doc[page_num]
+                # The page's content stream is decoded into one TextPage shared by
+                # the "text" and "words" extractions below
+                textpage = page.get_textpage()
+                # Extract text
+                text_parts.append(page.get_text("text", textpage=textpage) + "\n")
+                # Extract hyperlinks
+                links = page.get_links()
+                word_boxes = None
+                for link in links:
+                    if link.get("uri"):
+                        rect = link.get("from")
+                        link_text = ""
+                        if rect:
+                            if word_boxes is None:
+                                # Word boxes (x0, y0, x1, y1) are loaded once per page and
+                                # tested against each link rect in one vectorized pass
+                                words = page.get_text("words", textpage=textpage)
+                                word_boxes = np.array([w[:4] for w in words], dtype=np.float64).reshape(-1, 4)
+                                word_texts = [w[4] for w in words]
+                            inside = (
+                                (word_boxes[:, 0] >= rect.x0) & (word_boxes[:, 2] <= rect.x1)
+                                & (word_boxes[:, 1] >= rect.y0) & (word_boxes[:, 3] <= rect.y1)
+                            )
+                            link_text = " ".join(word_texts[i] for i in np.flatnonzero(inside))
+                        hyperlinks.append(f"Page {page_num + 1}: '{link_text}' -> {link['uri']}")
+    except Exception as pdf_err:
+        logger.error("Error reading PDF content from %s: %s", filename, pdf_err, exc_info=True)
+        raise FileParseError(400, f"Could not parse PDF file: {pdf_err}")
+    text = "".join(text_parts)
+    logger.info("Successfully extracted %s characters and %s hyperlinks from PDF: %s", len(text), len(hyperlinks), filename)
+    if hyperlinks:
+        text += "\n\nHyperlinks found in PDF:\n" + "\n".join(hyperlinks)
+    return text
+
+
+def _parse_docx(content: bytes, filename: str) -> str:
+    """Extracts paragraph text from DOCX bytes."""
+    try:
+        document = docx.Document(io.BytesIO(content))
+        text = "".join(para.text + "\n" for para in document.paragraphs)
+    except Exception as doc_err:
+        logger.error("Error reading Word content from %s: %s", filename, doc_err, exc_info=True)
+        raise FileParseError(400, f"Could not parse Word file: {doc_err}")
+    logger.info("Successfully extracted %s characters from Word file: %s", len(text), filename)
+    return text
+
+
+# Legacy .doc text control characters: paragraph/cell/row/line/page breaks
+# become newlines or tabs, other marks are dropped
+_DOC_CONTROL_CHARS = str.maketrans({
+    "\r": "\n", "\x0b": "\n", "\x0c": "\n", "\x0e": "\n", "\x07": "\t",
+    "\x1e": "-", "\x1f": None, "\x01": None, "\x08": None,
+})
+
+
+def _read_doc_text(content: bytes) -> str:
+    """
+    Reads the text of a Word 97-2003 .doc in-process by walking the piece table
+    of its WordDocument stream (MS-DOC 2.4.1).
+
+    Raises:
+        ValueError: If the file is encrypted or not a Word binary document.
+    """
+    with olefile.OleFileIO(io.BytesIO(content)) as ole:
+        word = ole.openstream("WordDocument").read()
+        wident, _, _, _, _, flags = struct.unpack_from("<HHHHHH", word, 0)
+        if wident != 0xA5EC:
+            raise ValueError("not a Word binary document")
+        if flags & 0x0100:
+            raise ValueError("document is encrypted")
+        table = ole.openstream("1Table" if flags & 0x0200 else "0Table").read()
+
+    # Locate the Clx (fcClx/lcbClx is pair 33 of FibRgFcLcb97) past the variable-size FIB parts
+    pos = 32
+    csw = struct.unpack_from("<H", word, pos)[0]
+    pos += 2 + csw * 2
+    cslw = struct.unpack_from("<H", word, pos)[0]
+    pos += 2 + cslw * 4 + 2
+    fc_clx, lcb_clx = struct.unpack_from("<II", word, pos + 33 * 8)
+    clx = table[fc_clx:fc_clx + lcb_clx]
+
+    # Skip any Prc entries to reach the Pcdt holding the PlcPcd
+    i = 0
+    while i < len(clx) and clx[i] == 0x01:
+        i += 3 + struct.unpack_from("<H", clx, i + 1)[0]
+    if i >= len(clx) or clx[i] != 0x02:
+        raise ValueError("piece table not found")
+    lcb = struct.unpack_from("<I", clx, i + 1)[0]
+    plc = clx[i + 5:i + 5 + lcb]
+    n = (lcb - 4) // 12
+    cps = struct.unpack_from(f"<{n + 1}I", plc, 0)
+
+    parts = []
+    for k in range(n):
+        fc = struct.unpack_from("<I", plc, 4 * (n + 1) + 8 * k + 2)[0]
+        count = cps[k + 1] - cps[k]
+        if fc & 0x40000000:
+            # Compressed piece: one cp1252 byte per character
+            start = (fc & 0x3FFFFFFF) // 2
+            parts.append(word[start:start + count].decode("cp1252", errors="replace"))
         else:
-            logger.warning(f"Unsupported file type: {content_type} for file {filename}")
-            raise HTTPException(
-                status_code=415, # Unsupported Media Type
-                detail=f"Unsupported file type: '{content_type}'. Please upload PDF, DOCX, MD, or TXT."
+            parts.append(word[fc:fc + 2 * count].decode("utf-16-le", errors="replace"))
+    text = "".join(parts)
+
+    # Keep field results but drop field instructions (\x13 instruction \x14 result \x15)
+    out = []
+    fields = []  # One entry per open field: True while still in its instruction
+    for segment in re.split(r"([\x13\x14\x15])", text):
+        if segment == "\x13":
+            fields.append(True)
+        elif segment == "\x14":
+            if fields:
+                fields[-1] = False
+        elif segment == "\x15":
+            if fields:
+                fields.pop()
+        elif not any(fields):
+            out.append(segment)
+    return "".join(out).translate(_DOC_CONTROL_CHARS)
+
+
+def _parse_doc(content: bytes, filename: str) -> str:
+    """
+    Extracts text from legacy DOC bytes in-process with olefile, falling back
+    to textract and then antiword for files it cannot read.
+    """
+    try:
+        text = _read_doc_text(content)
+        logger.info("Successfully extracted %s characters from Word file: %s", len(text), filename)
+        return text
+    except Exception as ole_err:
+        logger.warning("In-process DOC parsing failed for %s, falling back: %s", filename, ole_err)
+
+    text = ""
+    try:
+        # For .doc files, try using textract if available
+        import subprocess
+        with tempfile.NamedTemporaryFile(delete=True, suffix='.doc') as tmp:
+            tmp.write(content)
+            tmp.flush()
+            try:
+                # Try textract first
+                import textract
+                extracted = textract.process(tmp.name)
+                text += extracted.decode('utf-8', errors='replace')
+            except ImportError:
+                # Fallback to antiword if textract is not installed
+                try:
+                    result = subprocess.run([
+                        'antiword', tmp.name
+                    ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+                    text += result.stdout.decode('utf-8', errors='replace')
+                except Exception as antiword_err:
+                    logger.error("Error using antiword for DOC file %s: %s", filename, antiword_err, exc_info=True)
+                    raise FileParseError(400, f"Could not parse DOC file: {antiword_err}")
+    except FileParseError:
+        raise
+    except Exception as doc_err:
+        logger.error("Error reading Word content from %s: %s", filename, doc_err, exc_info=True)
+        raise FileParseError(400, f"Could not parse Word file: {doc_err}")
+    logger.info("Successfully extracted %s characters from Word file: %s", len(text), filename)
+    return text
+
+
+def _parse_text(content: bytes, filename: str) -> str:
+    """Decodes Markdown/plain text bytes."""
+    try:
+        # Strict UTF-8 stops at the first invalid byte, so non-UTF-8 files pay
+        # for at most a partial pass before the fallback
+        text = content.decode('utf-8')
+    except UnicodeDecodeError:
+        # latin-1 maps every byte, so this decode cannot fail and keeps accented
+        # characters that errors="replace" would turn into U+FFFD
+        logger.warning("UTF-8 decoding failed for %s, using latin-1.", filename)
+        text = content.decode('latin-1')
+    logger.info("Successfully extracted %s characters from Text/Markdown: %s", len(text), filename)
+    return text
+
+
+# Parsers by file extension, and by declared content type for uploads whose
+# filename has no recognised extension
+_HANDLERS_BY_EXT = {
+    ".pdf": _parse_pdf,
+    ".docx": _parse_docx,
+    ".doc": _parse_doc,
+    ".md": _parse_text,
+    ".txt": _parse_text,
+}
+_HANDLERS_BY_CT = {
+    "application/pdf": _parse_pdf,
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": _parse_docx,
+    "application/msword": _parse_doc,
+    "text/markdown": _parse_text,
+    "text/plain": _parse_text,
+}
+
+
+def parse_resume_bytes(content: bytes, filename: str, content_type: Optional[str]) -> str:
+    """
+    Extracts text (and PDF hyperlinks) from raw file bytes according to the file type.
+    Top-level and free of request objects so it can run in a pool worker.
+
+    Raises:
+        FileParseError: If the file is empty, unsupported or cannot be parsed.
+    """
+    try:
+        if not content:
+             logger.warning("File %s appears to be empty.", filename)
+             # Decide if empty file is error or just returns empty string
+             raise FileParseError(400, "Uploaded file is empty.")
+
+        ext = os.path.splitext(filename)[1].lower()
+        handler = _HANDLERS_BY_EXT.get(ext) or _HANDLERS_BY_CT.get(content_type)
+        if handler is None:
+            logger.warning("Unsupported file type: %s for file %s", content_type, filename)
+            raise FileParseError(
+                415, # Unsupported Media Type
+                f"Unsupported file type: '{content_type}'. Please upload PDF, DOCX, MD, or TXT."
             )
+        return handler(content, filename)
 
-    except HTTPException:
-        raise # Re-raise HTTP exceptions directly
+    except FileParseError:
+        raise # Re-raise parse errors directly
     except Exception as e:
-        logger.error(f"Failed to read or parse file {filename}: {e}", exc_info=True)
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error processing file {filename}. Please try again or contact support."
-        )
\ No newline at end of file
+        logger.error("Failed to read or parse file %s: %s", filename, e, exc_info=True)
+        raise FileParseError(
+            500,
+            f"Error processing file {filename}. Please try again or contact support."
+        )